@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Bytes on the wire and CPU time of the write bodies for each gzip level.
+
+Usage: python bench/bench_compression.py [batch_size] [rounds]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from module.lineprotocol import LineSerializer, gzip_compress  # noqa
+from module.point import Point  # noqa
+
+
+# A batch looking like the points of check results of a fleet
+def make_batch(size):
+    rand = random.Random(42)
+    points = []
+    now = 1403618279
+    while len(points) < size:
+        host = 'srv-%04d.example.com' % rand.randint(0, 999)
+        service = rand.choice(['cpu', 'disk /var', 'memory', 'http'])
+        tags = {'host_name': host, 'service_description': service}
+        for metric in ['load1', 'load5', 'load15']:
+            points.append(Point(
+                'metric_%s' % metric, tags, now,
+                {'value': round(rand.uniform(0, 10), 2), 'unit': '',
+                 'warning': 5.0, 'critical': 10.0, 'min': 0.0}
+            ))
+        points.append(Point(
+            'SERVICE_STATE', tags, now,
+            {'state_type': 'HARD', 'acknowledged': 0, 'state': 0,
+             'output': 'OK - load average: 0.12, 0.10, 0.08',
+             'last_check': now, 'last_state_change': now - 3600}
+        ))
+    return points[:size]
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    body = LineSerializer().serialize(make_batch(batch_size))
+    print 'batch of %d points, %d rounds' % (batch_size, rounds)
+    print '%-6s %12s %8s %14s' % ('level', 'bytes', 'ratio', 'ms per batch')
+    print '%-6s %12d %8.1f %14s' % ('none', len(body), 1.0, '-')
+
+    for level in (1, 3, 6, 9):
+        start = time.clock()
+        for _ in range(rounds):
+            compressed = gzip_compress(body, level)
+        elapsed = (time.clock() - start) * 1000 / rounds
+        print '%-6d %12d %8.1f %14.2f' % (
+            level, len(compressed), float(len(body)) / len(compressed),
+            elapsed
+        )
+
+
+if __name__ == '__main__':
+    main()
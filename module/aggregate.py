@@ -0,0 +1,167 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+
+from lineprotocol import make_prefix
+from point import Point
+
+AGGREGATE_FUNCTIONS = ('min', 'max', 'mean', 'last', 'first', 'sum',
+                       'count')
+
+
+# Samples of a series in one time window
+class Window(object):
+
+    __slots__ = ('point', 'start', 'count', 'min', 'max', 'sum', 'first',
+                 'last')
+
+    def __init__(self, point, start, value):
+        self.point = point
+        self.start = start
+        self.count = 1
+        self.min = self.max = self.sum = self.first = self.last = value
+
+    def add(self, point, value):
+        self.point = point
+        self.count += 1
+        self.sum += value
+        self.last = value
+        if value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def to_point(self, functions):
+        """
+        :return: Point at the start of the window, with the other fields of
+                 the last sample
+        """
+        fields = self.point.fields
+        del fields['value']
+        for function in functions:
+            if function == 'mean':
+                value = float(self.sum) / self.count
+            else:
+                value = getattr(self, function)
+            fields['value_%s' % function] = value
+        point = self.point
+        return Point(point.measurement, point.tags, self.start, fields,
+                     point.prefix)
+
+
+# Downsampling of the perfdata points.
+# The values of each series (measurement and tags) are aggregated in
+# windows of `window` seconds aligned on the epoch. A window is written
+# as a single point when a sample of a later window arrives or when it is
+# closed by `close`. The other points go through unchanged.
+# A sample older than the current window of its series, or than the closed
+# windows, would write a second point at the start of a window already
+# written. It is dropped and counted in self.late.
+# The windows are indexed by their start, so that closing the expired
+# windows does not go through all the series.
+class Aggregator(object):
+
+    def __init__(self, window, functions=('min', 'max', 'mean', 'last'),
+                 keep_raw=False, prefix='metric_'):
+        """
+        :param window: Length of the windows in seconds
+        :param functions: Aggregates written, from AGGREGATE_FUNCTIONS
+        :param keep_raw: Write the raw samples as well
+        :param prefix: Prefix of the aggregated measurements
+        """
+        self.window = window
+        self.functions = functions
+        self.keep_raw = keep_raw
+        self.prefix = prefix
+        self.windows = {}
+        # Keys of the windows by start, and heap of the starts
+        self.starts = {}
+        self.start_heap = []
+        self.closed_before = None
+        self.late = 0
+
+    def __len__(self):
+        return len(self.windows)
+
+    def open_window(self, key, point, start, value):
+        self.windows[key] = Window(point, start, value)
+        keys = self.starts.get(start)
+        if keys is None:
+            self.starts[start] = keys = set()
+            heapq.heappush(self.start_heap, start)
+        keys.add(key)
+
+    def add(self, points):
+        """
+        :param points: List of Point
+        :return: The points to write now
+        """
+        result = []
+        windows = self.windows
+        for point in points:
+            if not point.measurement.startswith(self.prefix) or \
+                    'value' not in point.field_keys:
+                result.append(point)
+                continue
+            value = point.field_values[point.field_keys.index('value')]
+            if not isinstance(value, (int, long, float)) or \
+                    isinstance(value, bool):
+                result.append(point)
+                continue
+            if self.keep_raw:
+                result.append(point)
+
+            key = point.prefix or make_prefix(point.measurement, point.tags)
+            start = int(point.time // self.window * self.window)
+            window = windows.get(key)
+            if window is None:
+                if self.closed_before is not None and \
+                        start + self.window <= self.closed_before:
+                    self.late += 1
+                    continue
+                self.open_window(key, point, start, value)
+            elif start > window.start:
+                result.append(window.to_point(self.functions))
+                self.starts[window.start].discard(key)
+                self.open_window(key, point, start, value)
+            elif start < window.start:
+                self.late += 1
+            else:
+                window.add(point, value)
+        return result
+
+    def close(self, before=None):
+        """
+        :param before: Only close the windows ended before this time, all
+                       the windows when None
+        :return: The points of the closed windows
+        """
+        result = []
+        heap = self.start_heap
+        while heap and (before is None or heap[0] + self.window <= before):
+            start = heapq.heappop(heap)
+            for key in self.starts.pop(start):
+                result.append(self.windows.pop(key).to_point(self.functions))
+        if before is not None and \
+                (self.closed_before is None or before > self.closed_before):
+            self.closed_before = before
+        return result
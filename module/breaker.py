@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+# Circuit breaker of the writes to an influxdb server.
+# After a failed write the circuit opens and no write is attempted for an
+# exponentially growing delay (with jitter, so that many brokers do not
+# retry at the same time). Once the delay is over a single writer is
+# allowed to probe the server (half open), its success closes the circuit
+# and its failure opens it again for a longer delay.
+class CircuitBreaker(object):
+
+    def __init__(self, backoff_min=1.0, backoff_max=60.0, jitter=0.5):
+        """
+        :param backoff_min: Seconds to wait after the first failure
+        :param backoff_max: Maximum number of seconds to wait
+        :param jitter: Part of the delay which is randomized
+        """
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        :return: True if a write can be attempted. Only the first caller
+                 after the delay is allowed, it becomes the probe.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() >= self.retry_at:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    @property
+    def probing(self):
+        return self.state == HALF_OPEN
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        """
+        :return: Seconds before the next write attempt
+        """
+        with self._lock:
+            self.failures += 1
+            delay = self.backoff()
+            self.state = OPEN
+            self.retry_at = time.time() + delay
+            return delay
+
+    # The probe had nothing to send, the next caller probes instead
+    def cancel_probe(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+    def backoff(self):
+        exponent = min(self.failures - 1, 30)
+        delay = min(self.backoff_max, self.backoff_min * 2 ** exponent)
+        return delay * (1 - self.jitter * random.random())
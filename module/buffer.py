@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import deque
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'drop_low_priority')
+
+
+def get_measurement(point):
+    return getattr(point, 'measurement', None)
+
+
+def estimate_size(point):
+    """
+    :param point: A Point
+    :return: Rough number of bytes the point takes once serialized
+    """
+    try:
+        size = len(point.measurement) + 12
+        for k, v in point.tags.iteritems():
+            size += len(k) + len(v) + 2
+        for k, v in zip(point.field_keys, point.field_values):
+            if isinstance(v, basestring):
+                size += len(k) + len(v) + 4
+            else:
+                size += len(k) + 10
+        return size
+    except (TypeError, AttributeError):
+        return len(str(point))
+
+
+# Fixed-capacity buffer of points.
+# The capacity is given in points and/or in bytes (0 means unlimited).
+# When it is full, the overflow policy decides which points are dropped:
+#  - drop_oldest: the oldest points are dropped to make room
+#  - drop_newest: the incoming points are dropped
+#  - drop_low_priority: the oldest low priority points (measurements
+#    starting with low_priority_prefix) are dropped first, then the oldest
+# Dropped points are counted per measurement in self.dropped.
+# This class is not thread safe, the broker protects it with its lock.
+class PointBuffer(object):
+
+    def __init__(self, max_points=0, max_bytes=0,
+                 overflow_policy='drop_oldest', low_priority_prefix='metric_'):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Unknown overflow policy %s, expected one of %s"
+                % (overflow_policy, ', '.join(OVERFLOW_POLICIES))
+            )
+        self.max_points = max_points
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+        self.low_priority_prefix = low_priority_prefix
+
+        self._high = deque()
+        self._low = deque()
+        self.size = 0
+        self.dropped = {}
+        self.dropped_total = 0
+
+    def __len__(self):
+        return len(self._high) + len(self._low)
+
+    def __iter__(self):
+        for point in self._high:
+            yield point
+        for point in self._low:
+            yield point
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < len(self._high):
+            return self._high[index]
+        return self._low[index - len(self._high)]
+
+    def _queue_for(self, point):
+        if self.overflow_policy == 'drop_low_priority':
+            measurement = get_measurement(point)
+            if measurement is not None and \
+                    measurement.startswith(self.low_priority_prefix):
+                return self._low
+        return self._high
+
+    def _is_full(self, incoming_size):
+        if self.max_points and len(self) >= self.max_points:
+            return True
+        if self.max_bytes and self.size + incoming_size > self.max_bytes:
+            return len(self) > 0
+        return False
+
+    def _count_dropped(self, point):
+        measurement = get_measurement(point)
+        self.dropped[measurement] = self.dropped.get(measurement, 0) + 1
+        self.dropped_total += 1
+
+    def _drop_oldest(self):
+        if self.overflow_policy == 'drop_low_priority' and self._low:
+            queue = self._low
+        else:
+            queue = self._high or self._low
+        point = queue.popleft()
+        if self.max_bytes:
+            self.size -= estimate_size(point)
+        self._count_dropped(point)
+
+    def _add(self, point):
+        point_size = estimate_size(point) if self.max_bytes else 0
+        while self._is_full(point_size):
+            if self.overflow_policy == 'drop_newest':
+                self._count_dropped(point)
+                return
+            self._drop_oldest()
+
+        self._queue_for(point).append(point)
+        self.size += point_size
+
+    def append(self, point):
+        self._add(point)
+
+    def extend(self, points):
+        for point in points:
+            self._add(point)
+
+    def requeue(self, points):
+        """
+        Put back points that could not be sent in front of the buffer.
+        They are older than the buffered points, when the buffer is full
+        they are the ones dropped, unless they are high priority points
+        and low priority points can be dropped instead.
+        :param points: Points in the order they were popped
+        """
+        for point in reversed(points):
+            point_size = estimate_size(point) if self.max_bytes else 0
+            queue = self._queue_for(point)
+            while self._is_full(point_size) and queue is self._high and \
+                    self._low:
+                self._drop_oldest()
+            if self._is_full(point_size):
+                self._count_dropped(point)
+                continue
+            queue.appendleft(point)
+            self.size += point_size
+
+    def pop_batch(self, count):
+        """
+        :param count: Maximum number of points to pop
+        :return: The oldest points, high priority first
+        """
+        batch = []
+        for queue in (self._high, self._low):
+            while queue and len(batch) < count:
+                batch.append(queue.popleft())
+        if self.max_bytes:
+            for point in batch:
+                self.size -= estimate_size(point)
+        return batch
+
+    def clear(self):
+        self._high.clear()
+        self._low.clear()
+        self.size = 0
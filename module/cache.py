@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+# Indexes in a link of the LRU list
+PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+
+# Thread safe cache keeping the max_size most recently used entries.
+# The entries are kept in a circular doubly linked list, the least recently
+# used entry being right after the root. Lookups are counted in self.hits
+# and self.misses.
+class LRUCache(object):
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def _move_to_end(self, link):
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+        last = self._root[PREV]
+        last[NEXT] = self._root[PREV] = link
+        link[PREV] = last
+        link[NEXT] = self._root
+
+    def get(self, key, default=None):
+        with self._lock:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._move_to_end(link)
+            return link[VALUE]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            link = self._links.get(key)
+            if link is not None:
+                link[VALUE] = value
+                self._move_to_end(link)
+                return
+
+            if len(self._links) >= self.max_size:
+                oldest = self._root[NEXT]
+                self._root[NEXT] = oldest[NEXT]
+                oldest[NEXT][PREV] = self._root
+                del self._links[oldest[KEY]]
+
+            last = self._root[PREV]
+            link = [last, self._root, key, value]
+            last[NEXT] = self._root[PREV] = link
+            self._links[key] = link
+
+    def clear(self):
+        with self._lock:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None]
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+
+from shinken.log import logger
+
+from point import Point
+
+SERIES_OVERFLOW = ('drop', 'count')
+OVERFLOW_MEASUREMENT = 'series_overflow'
+# Minimum seconds between two warnings about the dropped points
+WARNING_INTERVAL = 60
+
+
+# Set of keys in a fixed bit array, sized for `capacity` keys with an
+# `error_rate` chance of taking an unknown key for a known one. A known
+# key is never missed.
+class BloomFilter(object):
+
+    def __init__(self, capacity, error_rate=0.01):
+        size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        ))
+        self.size = max(size, 8)
+        self.hashes = max(int(round(
+            float(self.size) / capacity * math.log(2)
+        )), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def __contains__(self, key):
+        bits = self.bits
+        size = self.size
+        # Double hashing on the halves of the python hash
+        h = hash(key)
+        h1 = h & 0xffffffff
+        h2 = ((h >> 32) & 0xffffffff) | 1
+        for i in xrange(self.hashes):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        bits = self.bits
+        size = self.size
+        h = hash(key)
+        h1 = h & 0xffffffff
+        h2 = ((h >> 32) & 0xffffffff) | 1
+        for i in xrange(self.hashes):
+            position = (h1 + i * h2) % size
+            bits[position >> 3] |= 1 << (position & 7)
+
+
+# Limit the number of perfdata series written, in total and by host_name.
+# Only the measurements starting with `prefix` are limited, the states and
+# events of a host are always written. The series seen are kept in a bloom
+# filter, the counts are the number of series added to it. The points of a
+# new series over a limit are dropped. When counted, the number of
+# dropped points of each host is also written to the series_overflow
+# measurement at every report.
+class CardinalityGuard(object):
+
+    def __init__(self, limit=0, host_limit=0, overflow='drop',
+                 prefix='metric_'):
+        """
+        :param limit: Maximum number of series, 0 for no limit
+        :param host_limit: Maximum number of series by host_name, 0 for no
+                           limit
+        :param overflow: What to do with the points of the excess series,
+                         drop or count
+        :param prefix: Prefix of the limited measurements
+        """
+        if overflow not in SERIES_OVERFLOW:
+            raise ValueError(
+                "Unknown series_overflow %s, expected one of %s"
+                % (overflow, ', '.join(SERIES_OVERFLOW))
+            )
+        self.limit = limit
+        self.host_limit = host_limit
+        self.overflow = overflow
+        self.prefix = prefix
+        self.seen = BloomFilter(limit or 1000000)
+        self.series = 0
+        self.host_series = {}
+        # Points over the limits by host_name, since the start, until the
+        # last report and until the last warning
+        self.excess = {}
+        self.reported = {}
+        self.warned = {}
+        self.last_warning = None
+
+    def check(self, points):
+        """
+        :param points: List of Point
+        :return: The points of the series within the limits and of the
+                 measurements which are not limited
+        """
+        result = []
+        for point in points:
+            if not point.measurement.startswith(self.prefix):
+                result.append(point)
+                continue
+            # The order of the tags does not matter
+            key = (point.measurement, frozenset(point.tags.iteritems()))
+            if key in self.seen:
+                result.append(point)
+                continue
+
+            host = point.tags.get('host_name') or ''
+            host_series = self.host_series.get(host, 0)
+            if (self.limit and self.series >= self.limit) or \
+                    (self.host_limit and host_series >= self.host_limit):
+                self.excess[host] = self.excess.get(host, 0) + 1
+                continue
+
+            self.seen.add(key)
+            self.series += 1
+            self.host_series[host] = host_series + 1
+            result.append(point)
+        return result
+
+    def report(self, timestamp):
+        """
+        Log the hosts over the limits, at most every WARNING_INTERVAL seconds
+        :param timestamp: Time of the report and of the series_overflow
+                          points
+        :return: The series_overflow points of the points dropped since the
+                 last report when counting
+        """
+        points = []
+        for host, count in sorted(self.excess.iteritems()):
+            new = count - self.reported.get(host, 0)
+            if new > 0:
+                self.reported[host] = count
+                points.append(Point(
+                    OVERFLOW_MEASUREMENT,
+                    {'host_name': host} if host else {}, timestamp,
+                    {'points': new}
+                ))
+
+        if self.last_warning is None or \
+                timestamp - self.last_warning >= WARNING_INTERVAL:
+            hosts = []
+            for host, count in sorted(self.excess.iteritems()):
+                new = count - self.warned.get(host, 0)
+                if new > 0:
+                    hosts.append('%s: %d' % (host or '-', new))
+                    self.warned[host] = count
+            if hosts:
+                self.last_warning = timestamp
+                logger.warning(
+                    "[influxdb broker] Series limits reached (%d series, "
+                    "limit %d, by host %d), dropped the points of new "
+                    "series. Points by host: %s"
+                    % (self.series, self.limit, self.host_limit,
+                       ', '.join(hosts))
+                )
+
+        if self.overflow == 'count':
+            return points
+        return []
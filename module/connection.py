@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Client errors which do not come from the points themselves, the write
+# can succeed later
+RETRY_STATUS_CODES = (401, 403, 404, 408, 429)
+
+
+# Raised when influxdb answers with an unexpected status code
+class InfluxdbError(Exception):
+
+    def __init__(self, status_code, content):
+        Exception.__init__(
+            self, "influxdb returned %d: %s" % (status_code, content)
+        )
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def rejected(self):
+        """
+        :return: True if influxdb refused the points, sending them again
+                 would fail the same way
+        """
+        return 400 <= self.status_code < 500 and \
+            self.status_code not in RETRY_STATUS_CODES
+
+
+# HTTP connection to the influxdb API.
+# It keeps a pool of at most max_connections keep-alive connections shared
+# by all the writer threads, a thread waits for a free connection instead
+# of opening a new one. Every request is bounded by connect_timeout and
+# read_timeout (in seconds).
+class InfluxdbConnection(object):
+
+    def __init__(self, host, port, user, password, database,
+                 use_https=False, verify_ssl=False, connect_timeout=5.0,
+                 read_timeout=30.0, max_connections=1):
+        scheme = 'https' if use_https else 'http'
+        self.base_url = '%s://%s:%d' % (scheme, host, port)
+        self.database = database
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.verify = verify_ssl
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections,
+            max_retries=0, pool_block=True
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def write(self, body, headers=None):
+        """
+        :param body: Line protocol data with a time in seconds
+        :param headers: Additional HTTP headers
+        """
+        response = self.session.post(
+            self.base_url + '/write',
+            params={'db': self.database, 'precision': 's'},
+            data=body, headers=headers, timeout=self.timeout
+        )
+        if response.status_code != 204:
+            raise InfluxdbError(response.status_code, response.content)
+
+    def query(self, query):
+        """
+        :param query: InfluxQL query on the database
+        :return: The decoded json result
+        """
+        response = self.session.get(
+            self.base_url + '/query',
+            params={'db': self.database, 'q': query}, timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise InfluxdbError(response.status_code, response.content)
+        return response.json()
+
+    def close(self):
+        self.session.close()
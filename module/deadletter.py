@@ -0,0 +1,55 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+import time
+
+
+# File where the points refused by influxdb are kept.
+# Each group of rejected lines is preceded by a comment with the time, the
+# endpoint and the error, the file stays valid line protocol and can be
+# imported again once the points are fixed.
+class DeadLetterFile(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def append(self, lines, endpoint, error):
+        """
+        :param lines: Line protocol lines, ending with a newline
+        :param endpoint: Name of the endpoint which refused them
+        :param error: The error returned by influxdb
+        """
+        header = '# %d %s: %s\n' % (
+            time.time(), endpoint, ' '.join(str(error).split())
+        )
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(header)
+                f.writelines(lines)
+            self.count += len(lines)
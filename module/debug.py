@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from shinken.log import logger
+
+
+def debug_enabled():
+    """
+    :return: True if the debug messages are logged. The level can change
+             while the broker runs, it must be checked before each message.
+    """
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+# Keeps one item out of `every` for the debug logs, so that the debug
+# level can be used on a busy broker
+class DebugSampler(object):
+
+    def __init__(self, every=1):
+        self.every = max(every, 1)
+        self.seen = 0
+
+    def sample(self, items):
+        """
+        :param items: List of points or lines
+        :return: The items to log
+        """
+        if self.every == 1:
+            return items
+        start = -self.seen % self.every
+        self.seen += len(items)
+        return items[start::self.every]
@@ -0,0 +1,416 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import socket
+import threading
+from collections import deque
+
+from shinken.log import logger
+
+from breaker import CircuitBreaker
+from buffer import PointBuffer
+from connection import InfluxdbConnection, InfluxdbError
+from debug import DebugSampler, debug_enabled
+from lineprotocol import gzip_compress
+from spool import Spool, SpoolLocked
+from writer import InfluxdbWriter
+
+
+def is_rejected(e):
+    """
+    :return: True if influxdb refused the points themselves
+    """
+    return isinstance(e, InfluxdbError) and e.rejected
+
+
+# One influxdb server the points are written to.
+# Every endpoint has its own buffer, writer threads, spool and failure
+# count, so a slow or down server does not hold back the others.
+# The settings (credentials, buffer size, ...) are read from `conf`,
+# usually the InfluxdbBroker.
+class Endpoint(object):
+
+    def __init__(self, host, port, conf, serializer):
+        self.host = host
+        self.port = port
+        self.name = '%s:%d' % (host, port)
+        self.conf = conf
+        self.serializer = serializer
+
+        self._lock = threading.Lock()
+        self.buffer = PointBuffer(
+            conf.buffer_size, conf.buffer_max_bytes, conf.buffer_overflow,
+            conf.perfdata_prefix
+        )
+        self.reported_dropped = 0
+        # Bodies serialized by the serializer processes
+        self.bodies = deque()
+        self.bodies_points = 0
+        self.dropped_bodies_points = 0
+        self.writers = []
+        self.debug_sampler = DebugSampler(conf.debug_sampling)
+        self.breaker = CircuitBreaker(
+            conf.retry_backoff_min, conf.retry_backoff_max
+        )
+
+        self.db = None
+        self.udp_socket = None
+        self.compression = conf.compression
+        self.spool = None
+        self._replay_lock = threading.Lock()
+
+    def init(self):
+        conf = self.conf
+        self.db = InfluxdbConnection(
+            self.host, self.port, conf.user, conf.password, conf.database,
+            use_https=conf.use_https, verify_ssl=conf.verify_ssl,
+            connect_timeout=conf.connect_timeout,
+            read_timeout=conf.read_timeout,
+            max_connections=conf.max_connections
+        )
+        if conf.use_udp:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.compression != 'none':
+                logger.warning(
+                    "[influxdb broker] Compression is not available over "
+                    "udp, the points are sent uncompressed"
+                )
+
+        if conf.spool_dir:
+            spool_dir = conf.spool_dir
+            # Each endpoint replays its own points
+            if len(conf.endpoints) > 1:
+                spool_dir = os.path.join(
+                    spool_dir, self.name.replace(':', '_')
+                )
+            try:
+                self.spool = Spool(spool_dir, conf.spool_max_bytes)
+            except SpoolLocked as e:
+                # Two spools would replay the same records
+                logger.error(
+                    "[influxdb broker] %s, the unsent points of %s are not "
+                    "spooled" % (e, self.name)
+                )
+                return
+            logger.info(
+                "[influxdb broker] Spooling unsent points of %s in %s, "
+                "%d bytes waiting to be replayed"
+                % (self.name, spool_dir, len(self.spool))
+            )
+
+    def quit(self):
+        self.stop_writers()
+        # Last chance to send what is left in the buffer, what can not be
+        # sent is spooled for the next start
+        self.flush()
+        if self.spool is not None:
+            self.spool_buffer()
+            self.spool.close()
+        if self.db is not None:
+            self.db.close()
+
+    def extend(self, points):
+        with self._lock:
+            self.buffer.extend(points)
+            full = len(self.buffer) >= self.conf.batch_size
+
+        # Do not wait for the flush interval when a batch is ready
+        if full and self.writers:
+            self.writers[0].wakeup()
+
+    def extend_body(self, body):
+        """
+        :param body: Line protocol data, written before the buffered points
+        """
+        count = body.count('\n')
+        with self._lock:
+            self.bodies.append(body)
+            self.bodies_points += count
+            # Same limit as the buffer, the oldest bodies are dropped
+            while self.conf.buffer_size > 0 and len(self.bodies) > 1 and \
+                    self.bodies_points > self.conf.buffer_size:
+                dropped = self.bodies.popleft().count('\n')
+                self.bodies_points -= dropped
+                self.dropped_bodies_points += dropped
+            full = self.bodies_points >= self.conf.batch_size
+
+        if full and self.writers:
+            self.writers[0].wakeup()
+
+    def pop_body(self):
+        with self._lock:
+            if not self.bodies:
+                return None
+            body = self.bodies.popleft()
+            self.bodies_points -= body.count('\n')
+            return body
+
+    def requeue_body(self, body):
+        with self._lock:
+            self.bodies.appendleft(body)
+            self.bodies_points += body.count('\n')
+
+    # Start the threads writing the buffer to influxdb. Dead writers
+    # are replaced so a crashed thread does not stop the flushing.
+    def start_writers(self):
+        self.writers = [w for w in self.writers if w.is_alive()]
+        while len(self.writers) < self.conf.writer_threads:
+            writer = InfluxdbWriter(
+                self.flush, self.conf.flush_interval,
+                name='influxdb-writer-%s-%d' % (self.name, len(self.writers))
+            )
+            writer.start()
+            self.writers.append(writer)
+
+    def stop_writers(self):
+        for writer in self.writers:
+            writer.stop(timeout=self.conf.flush_interval + 1)
+        self.writers = []
+
+    # Send the buffer to influxdb, called by the writer threads
+    def flush(self):
+        self.report_dropped()
+
+        # Leave influxdb alone until the backoff delay is over
+        if not self.breaker.allow():
+            if self.spool is not None:
+                self.spool_buffer()
+            return
+
+        try:
+            self.write_buffer()
+        finally:
+            # Let the next flush probe if this one had nothing to send
+            self.breaker.cancel_probe()
+
+    def write_buffer(self):
+        # Spooled points are older than the buffered ones, they go first.
+        # While they can not be sent, the buffer is spooled behind them.
+        if self.spool is not None and not self.replay_spool():
+            self.spool_buffer()
+            return
+
+        if not self.write_bodies():
+            if self.spool is not None:
+                self.spool_buffer()
+            return
+
+        with self._lock:
+            pending = len(self.buffer)
+
+        # Send the points in chunks of at most batch_size points. Points
+        # buffered while we are writing will be sent on the next flush.
+        while pending > 0:
+            size = min(pending, self.conf.batch_size)
+            # Probe a recovering server with a few points before sending
+            # it the backlog
+            if self.breaker.probing:
+                size = min(size, self.conf.probe_size)
+            with self._lock:
+                batch = self.buffer.pop_batch(size)
+            if not batch:
+                break
+            pending -= len(batch)
+            body = self.serializer.serialize(batch)
+            if not self.send(body):
+                if self.spool is not None:
+                    self.spool.append(body)
+                    self.spool_buffer()
+                else:
+                    # Put back the points in front of the buffer
+                    with self._lock:
+                        self.buffer.requeue(batch)
+                break
+
+    def write_bodies(self):
+        """
+        :return: False if a body could not be sent
+        """
+        while True:
+            body = self.pop_body()
+            if body is None:
+                return True
+            if not self.send(body):
+                if self.spool is not None:
+                    self.spool.append(body)
+                else:
+                    self.requeue_body(body)
+                return False
+
+    def send(self, body):
+        """
+        :param body: Line protocol data
+        :return: False if the body could not be sent and must be kept
+        """
+        try:
+            self.write_body(body)
+        except Exception as e:
+            if not is_rejected(e):
+                self.write_failed(e)
+                return False
+            # The server is fine, some points are not
+            self.breaker.success()
+            return self.bisect(body, e)
+        self.breaker.success()
+        return True
+
+    def bisect(self, body, error):
+        """
+        Send the halves of a rejected body, then the halves of the rejected
+        halves, ... until the rejected points are isolated. They go to the
+        dead letter file, the others are written. After
+        conf.bisect_max_requests writes, the parts not isolated yet are
+        handled as rejected.
+        :param body: Line protocol data refused by influxdb
+        :param error: The error returned for the body
+        :return: False if the server failed in the meantime, the whole body
+                 must be kept. Sending again the points which were already
+                 written only overwrites them with the same values.
+        """
+        rejected = []
+        # A \r can be in a string field, only \n ends a line
+        lines = [line + '\n' for line in body.split('\n') if line]
+        chunks = [(lines, error)]
+        requests = 0
+        while chunks:
+            lines, error = chunks.pop()
+            if len(lines) == 1 or requests >= self.conf.bisect_max_requests:
+                rejected.append((lines, error))
+                continue
+
+            half = len(lines) // 2
+            refused = []
+            for part in (lines[:half], lines[half:]):
+                requests += 1
+                try:
+                    self.write_body(''.join(part))
+                except Exception as e:
+                    if not is_rejected(e):
+                        self.write_failed(e)
+                        return False
+                    refused.append((part, e))
+            # The first half is handled first
+            chunks.extend(reversed(refused))
+
+        for lines, error in rejected:
+            self.write_rejected(lines, error)
+        return True
+
+    # Send line protocol data to the /write endpoint (or the udp port)
+    def write_body(self, body):
+        if not body:
+            return
+        if debug_enabled():
+            lines = [line + '\n' for line in body.split('\n') if line]
+            logger.debug(
+                "[influxdb broker] Writing %d points to %s: %s"
+                % (len(lines), self.name,
+                   ''.join(self.debug_sampler.sample(lines)))
+            )
+        if self.udp_socket is not None:
+            self.udp_socket.sendto(body, (self.host, self.conf.udp_port))
+            return
+
+        headers = {'Content-Type': 'application/octet-stream'}
+        if self.compression == 'gzip':
+            body = gzip_compress(body, self.conf.compression_level)
+            headers['Content-Encoding'] = 'gzip'
+        self.db.write(body, headers)
+
+    def write_failed(self, e):
+        delay = self.breaker.failure()
+        logger.error("[influxdb broker] %s: %s" % (self.name, e))
+        logger.error(
+            "[influxdb broker] Sending data to %s Failed. "
+            "Failed attempts: %d, next attempt in %.1fs, "
+            "buffered points: %d, spooled bytes: %d"
+            % (self.name, self.breaker.failures, delay, len(self.buffer),
+               len(self.spool) if self.spool is not None else 0)
+        )
+
+    def write_rejected(self, lines, e):
+        dead_letter = self.conf.dead_letter
+        if dead_letter is not None:
+            dead_letter.append(lines, self.name, e)
+        logger.error(
+            "[influxdb broker] %s rejected %s, %s: %s"
+            % (self.name, ''.join(lines).rstrip('\n'),
+               'written to %s' % dead_letter.path if dead_letter else
+               'dropped', e)
+        )
+
+    def replay_spool(self):
+        """
+        Send the spooled batches in order
+        :return: True if the spool is now empty
+        """
+        # Only one writer replays the spool, the others must not send
+        # newer points in the meantime
+        if not self._replay_lock.acquire(False):
+            return False
+        try:
+            while True:
+                record = self.spool.peek()
+                if record is None:
+                    return True
+                # The oldest record is the probe of a recovering server
+                if not self.send(record):
+                    return False
+                self.spool.pop()
+        finally:
+            self._replay_lock.release()
+
+    # Move the whole buffer to the spool
+    def spool_buffer(self):
+        while True:
+            body = self.pop_body()
+            if body is None:
+                break
+            self.spool.append(body)
+        while True:
+            with self._lock:
+                batch = self.buffer.pop_batch(self.conf.batch_size)
+            if not batch:
+                break
+            self.spool.append(self.serializer.serialize(batch))
+
+    # Log the points dropped by the buffer and the points which could not
+    # be serialized since the last report
+    def report_dropped(self):
+        invalid = self.serializer.pop_invalid()
+        if invalid > 0:
+            logger.error(
+                "[influxdb broker] Could not serialize %d points (invalid "
+                "names or values), %d in total"
+                % (invalid, self.serializer.invalid)
+            )
+
+        total = self.buffer.dropped_total + self.dropped_bodies_points
+        dropped = total - self.reported_dropped
+        if dropped > 0:
+            self.reported_dropped = total
+            logger.error(
+                "[influxdb broker] Buffer of %s full (%s), lost %d points. "
+                "Total lost per measurement: %s, serialized perfdata: %d"
+                % (self.name, self.conf.buffer_overflow, dropped,
+                   self.buffer.dropped, self.dropped_bodies_points)
+            )
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+from shinken.log import logger
+
+from point import intern_keys
+
+# Influxdb type of the python values, as returned by SHOW FIELD KEYS
+type_names = {
+    float: 'float',
+    int: 'integer',
+    long: 'integer',
+    bool: 'boolean',
+    str: 'string',
+    unicode: 'string',
+}
+
+
+def coerce(value, type_name):
+    """
+    :param value: A field value
+    :param type_name: The influxdb type the field must have
+    :return: The value converted to the type, None if it can not be
+    """
+    try:
+        if type_name == 'float':
+            if isinstance(value, bool):
+                return None
+            return float(value)
+        if type_name == 'integer':
+            if isinstance(value, bool):
+                return None
+            if isinstance(value, float):
+                return int(value) if value.is_integer() else None
+            return int(value)
+        if type_name == 'boolean':
+            if value in (0, 1):
+                return bool(value)
+            return {'true': True, 'false': False}.get(str(value).lower())
+        if type_name == 'string':
+            return value if isinstance(value, unicode) else str(value)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return None
+
+
+# Type of every (measurement, field) written.
+# Influxdb refuses a point whose field has not the type of the first value
+# written in the shard. The first type seen for a field is kept and the
+# next values are converted to it, or dropped when they can not be.
+class FieldTypeRegistry(object):
+
+    def __init__(self):
+        self.types = {}
+        self.coerced = 0
+        self.dropped = 0
+        self.reported = set()
+
+    def __len__(self):
+        return len(self.types)
+
+    def learn(self, measurement, field, type_name):
+        """
+        Set the type of a field if it is not known yet
+        """
+        self.types.setdefault((measurement, field), type_name)
+
+    def warm(self, result):
+        """
+        :param result: The decoded result of SHOW FIELD KEYS
+        :return: Number of fields learnt
+        """
+        count = 0
+        for statement in result.get('results', []):
+            for series in statement.get('series', []):
+                key_column = series['columns'].index('fieldKey')
+                type_column = series['columns'].index('fieldType')
+                for row in series.get('values', []):
+                    self.learn(series['name'], row[key_column],
+                               row[type_column])
+                    count += 1
+        return count
+
+    def check(self, points):
+        """
+        Convert the fields of the points to their known type
+        :param points: List of Point, modified in place
+        :return: The points still having fields
+        """
+        types = self.types
+        result = []
+        for point in points:
+            measurement = point.measurement
+            for key, value in zip(point.field_keys, point.field_values):
+                type_name = type_names.get(type(value), 'string')
+                known = types.get((measurement, key))
+                if known is None:
+                    types[(measurement, key)] = type_name
+                elif known != type_name:
+                    self.fix(point)
+                    break
+            if point.field_keys:
+                result.append(point)
+        return result
+
+    def fix(self, point):
+        keys = []
+        values = []
+        for key, value in zip(point.field_keys, point.field_values):
+            known = self.types.setdefault(
+                (point.measurement, key), type_names.get(type(value), 'string')
+            )
+            if type_names.get(type(value)) != known:
+                converted = coerce(value, known)
+                self.report(point.measurement, key, value, known, converted)
+                if converted is None:
+                    self.dropped += 1
+                    continue
+                self.coerced += 1
+                value = converted
+            keys.append(key)
+            values.append(value)
+        point.field_keys = intern_keys(tuple(keys))
+        point.field_values = tuple(values)
+
+    # Log each kind of conflict once
+    def report(self, measurement, field, value, type_name, converted):
+        conflict = (measurement, field, type(value))
+        if conflict in self.reported:
+            return
+        self.reported.add(conflict)
+        logger.warning(
+            "[influxdb broker] Field %s of %s is a %s, got %r: %s" % (
+                field, measurement, type_name, value,
+                'converted' if converted is not None else 'dropped'
+            )
+        )
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Serialization of the points to the InfluxDB line protocol.
+https://docs.influxdata.com/influxdb/v0.9/write_protocols/line/
+"""
+
+import threading
+import zlib
+
+from cache import LRUCache
+
+
+def to_unicode(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+def escape_measurement(value):
+    return to_unicode(value).replace(
+        '\\', '\\\\'
+    ).replace(
+        ' ', '\\ '
+    ).replace(
+        ',', '\\,'
+    ).replace(
+        '\n', '\\n'
+    )
+
+
+# Used for tag keys, tag values and field keys
+def escape_key(value):
+    value = to_unicode(value).replace(
+        '\\', '\\\\'
+    ).replace(
+        ' ', '\\ '
+    ).replace(
+        ',', '\\,'
+    ).replace(
+        '=', '\\='
+    ).replace(
+        '\n', '\\n'
+    )
+    if value.endswith('\\'):
+        value += ' '
+    return value
+
+
+def escape_field_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, long)):
+        return '%di' % value
+    return u'"%s"' % to_unicode(value).replace(
+        '\\', '\\\\'
+    ).replace(
+        '"', '\\"'
+    ).replace(
+        '\n', '\\n'
+    )
+
+
+def make_prefix(measurement, tags):
+    """
+    :param measurement: Name of the measurement
+    :param tags: Tags of the point
+    :return: The escaped 'measurement,tag=value,...' part of a line
+    """
+    prefix = escape_measurement(measurement)
+    for key in sorted(tags):
+        value = tags[key]
+        if key and value:
+            prefix += u',%s=%s' % (escape_key(key), escape_key(value))
+    return prefix
+
+
+def gzip_compress(body, level=6):
+    """
+    :param body: Data to compress
+    :param level: zlib compression level, from 1 (fast) to 9 (small)
+    :return: The data in gzip format
+    """
+    # wbits 16 + 15 makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+# Serialize points to line protocol.
+# The escaped measurement and tags of a line only depend on the series, they
+# are computed once and kept in a LRU cache of at most cache_size series,
+# unless the point already comes with its prefix.
+class LineSerializer(object):
+
+    def __init__(self, cache_size=100000):
+        self.cache_size = cache_size
+        self.prefixes = LRUCache(cache_size)
+        self.escaped_keys = {}
+        self.invalid = 0
+        self.reported_invalid = 0
+        self._report_lock = threading.Lock()
+
+    def get_prefix(self, measurement, tags):
+        key = (measurement, tuple(sorted(tags.iteritems())))
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            prefix = make_prefix(measurement, tags)
+            self.prefixes.set(key, prefix)
+        return prefix
+
+    def pop_invalid(self):
+        """
+        :return: The number of invalid points since the last call
+        """
+        with self._report_lock:
+            invalid = self.invalid - self.reported_invalid
+            self.reported_invalid += invalid
+            return invalid
+
+    def get_escaped_keys(self, field_keys):
+        escaped = self.escaped_keys.get(field_keys)
+        if escaped is None:
+            escaped = tuple([escape_key(k) + u'=' for k in field_keys])
+            if len(self.escaped_keys) >= self.cache_size:
+                self.escaped_keys.clear()
+            self.escaped_keys[field_keys] = escaped
+        return escaped
+
+    def make_line(self, point):
+        """
+        :param point: A Point
+        :return: The line of the point, None if it has no fields
+        """
+        if not point.field_keys:
+            return None
+        fields = u','.join([
+            k + escape_field_value(v) for k, v in
+            zip(self.get_escaped_keys(point.field_keys), point.field_values)
+        ])
+        prefix = point.prefix or \
+            self.get_prefix(point.measurement, point.tags)
+        return u'%s %s %d' % (prefix, fields, point.time)
+
+    def serialize(self, points):
+        """
+        :param points: Points with a time in seconds
+        :return: The utf-8 encoded body of a write request. Invalid points
+                 are skipped and counted in self.invalid
+        """
+        lines = []
+        for point in points:
+            try:
+                line = self.make_line(point)
+            except (KeyError, IndexError, TypeError, ValueError,
+                    AttributeError, UnicodeDecodeError):
+                # This point would make the whole write fail
+                self.invalid += 1
+                continue
+            if line is not None:
+                lines.append(line)
+        if not lines:
+            return ''
+        return (u'\n'.join(lines) + u'\n').encode('utf-8')
@@ -19,12 +19,19 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import re
 
-event_type_pattern = re.compile('^\[[0-9]{10}] (?:HOST|SERVICE) (ALERT|NOTIFICATION|FLAPPING|DOWNTIME)(?: ALERT)?:.*')
+# Event types parsed by default, the others must be enabled
+default_event_types = ['NOTIFICATION', 'ALERT', 'DOWNTIME', 'FLAPPING']
+
+# Conversions of the properties available in the event types files
+type_converters = {'int': int, 'float': float}
+
 event_types = {
     'NOTIFICATION': {  # ex: "[1402515279] SERVICE NOTIFICATION: admin;localhost;check-ssh;CRITICAL;notify-service-by-email;Connection refused"
-        'pattern': '\[([0-9]{10})\] (HOST|SERVICE) (NOTIFICATION): ([^\;]*);([^\;]*);(?:([^\;]*);)?([^\;]*);([^\;]*);(ACKNOWLEDGEMENT)?.*',
+        'headers': ['HOST NOTIFICATION', 'SERVICE NOTIFICATION'],
+        'pattern': '\[([0-9]{10})\] (HOST|SERVICE) (NOTIFICATION): ([^\;]*);([^\;]*);(?:([^\;]*);)?([^\;]*);([^\;]*);([^\;]*)',
         'properties': [
             'time',
             'notification_type',  # 'SERVICE' (or could be 'HOST')
@@ -34,10 +41,11 @@ event_types = {
             'service_desc',  # 'check-ssh' (or could be None)
             'state',  # 'CRITICAL'
             'notification_method',  # 'notify-service-by-email'
-            'acknownledgement',  # None or 'ACKNOWLEDGEMENT'
+            'output',  # 'Connection refused'
         ]
     },
     'ALERT': {  # ex: "[1329144231] SERVICE ALERT: dfw01-is02-006;cpu load maui;WARNING;HARD;4;WARNING - load average: 5.04, 4.67, 5.04"
+        'headers': ['HOST ALERT', 'SERVICE ALERT'],
         'pattern': '^\[([0-9]{10})] (HOST|SERVICE) (ALERT): ([^\;]*);(?:([^\;]*);)?([^\;]*);([^\;]*);([^\;]*);([^\;]*)',
         'properties': [
             'time',
@@ -49,9 +57,11 @@ event_types = {
             'state_type',  # 'HARD'
             'attempts',  # '4'
             'output',  # 'WARNING - load average: 5.04, 4.67, 5.04'
-        ]
+        ],
+        'types': {'attempts': int},
     },
     'DOWNTIME': {  # ex: "[1279250211] HOST DOWNTIME ALERT: maast64;STARTED; Host has entered a period of scheduled downtime"
+        'headers': ['HOST DOWNTIME ALERT', 'SERVICE DOWNTIME ALERT'],
         'pattern': '^\[([0-9]{10})\] (HOST|SERVICE) (DOWNTIME) ALERT: ([^\;]*);(STARTED|STOPPED|CANCELLED);(.*)',
         'properties': [
             'time',
@@ -64,6 +74,7 @@ event_types = {
     },
     'FLAPPING': {  # service flapping ex: "[1375301662] SERVICE FLAPPING ALERT: testhost;check_ssh;STARTED; Service appears to have started flapping (24.2% change >= 20.0% threshold)"
                    # host flapping ex: "[1375301662] HOST FLAPPING ALERT: hostbw;STARTED; Host appears to have started flapping (20.1% change > 20.0% threshold)"
+        'headers': ['HOST FLAPPING ALERT', 'SERVICE FLAPPING ALERT'],
         'pattern': '^\[([0-9]{10})] (HOST|SERVICE) (FLAPPING) ALERT: ([^\;]*);(?:([^\;]*);)?([^\;]*);([^\;]*)',
         'properties': [
             'time',
@@ -74,36 +85,227 @@ event_types = {
             'state', # 'STOPPED' or 'STARTED'
             'output', # example: 'Service appears to have started flapping (24.2% change >= 20.0% threshold)'
         ]
+    },
+    'CURRENT_STATE': {  # ex: "[1402515279] CURRENT SERVICE STATE: localhost;check-ssh;OK;HARD;1;SSH OK"
+        'headers': ['CURRENT HOST STATE', 'CURRENT SERVICE STATE'],
+        'pattern': '^\[([0-9]{10})\] CURRENT (HOST|SERVICE) STATE: ([^\;]*);(?:([^\;]*);)?([^\;]*);([^\;]*);([0-9]+);(.*)',
+        'properties': [
+            'time',
+            'alert_type',  # 'SERVICE' or 'HOST'
+            'hostname',  # 'localhost'
+            'service_desc',  # 'check-ssh' (or could be None)
+            'state',  # 'OK'
+            'state_type',  # 'HARD'
+            'attempts',  # '1'
+            'output',  # 'SSH OK'
+        ],
+        'types': {'attempts': int},
+    },
+    'PASSIVE_CHECK': {  # ex: "[1402515279] PASSIVE SERVICE CHECK: localhost;backup;2;Backup failed"
+        'headers': ['PASSIVE HOST CHECK', 'PASSIVE SERVICE CHECK'],
+        'pattern': '^\[([0-9]{10})\] PASSIVE (HOST|SERVICE) CHECK: ([^\;]*);(?:([^\;]*);)?([0-9]+);(.*)',
+        'properties': [
+            'time',
+            'check_type',  # 'SERVICE' or 'HOST'
+            'hostname',  # 'localhost'
+            'service_desc',  # 'backup' (or could be None)
+            'return_code',  # '2'
+            'output',  # 'Backup failed'
+        ],
+        'types': {'return_code': int},
+    },
+    'EXTERNAL_COMMAND': {  # ex: "[1402515279] EXTERNAL COMMAND: ACKNOWLEDGE_SVC_PROBLEM;localhost;check-ssh;2;1;0;admin;On it"
+        'headers': ['EXTERNAL COMMAND'],
+        # The service commands, then the host commands, then the others.
+        # The group commands and the commands on a comment or downtime id
+        # do not have a host as first argument.
+        'pattern': '^\[([0-9]{10})\] EXTERNAL COMMAND: (?:'
+                   '((?![A-Z_]*(?:GROUP|HOST_SVC))[A-Z_]*_SVC_[A-Z_]*|PROCESS_SERVICE_CHECK_RESULT);([^\;]*);([^\;]*)'
+                   '|((?![A-Z_]*GROUP|DEL_HOST_(?:COMMENT|DOWNTIME);)[A-Z_]*_HOST(?:_[A-Z_]*)?);([^\;]*)'
+                   '|([^\;]*))(?:;(.*))?',
+        'properties': [
+            'time',
+            'command',  # 'ACKNOWLEDGE_SVC_PROBLEM'
+            'hostname',  # 'localhost'
+            'service_desc',  # 'check-ssh'
+            'command',  # 'ACKNOWLEDGE_HOST_PROBLEM'
+            'hostname',  # 'localhost'
+            'command',  # 'PROCESS_FILE'
+            'arguments',  # '2;1;0;admin;On it' (or could be None)
+        ],
+        'tags': ['command'],
+    },
+    'TIMEPERIOD_TRANSITION': {  # ex: "[1327392000] TIMEPERIOD TRANSITION: workhours;-1;1"
+        'headers': ['TIMEPERIOD TRANSITION'],
+        'pattern': '^\[([0-9]{10})\] TIMEPERIOD TRANSITION: ([^\;]*);(-?[0-9]+);(-?[0-9]+)',
+        'properties': [
+            'time',
+            'timeperiod',  # 'workhours'
+            'from',  # -1 on startup
+            'to',  # 1 if the timeperiod starts, 0 if it ends
+        ],
+        'types': {'from': int, 'to': int},
+        'tags': ['timeperiod'],
     }
 }
 
 
-# Class for parsing event logs
-# Populates self.data with the log type's properties
-class LogEvent:
+def name_groups(pattern, properties):
+    """
+    :param pattern: Regex whose capturing groups are the properties
+    :param properties: Names of the groups, in order. A property can have
+                       several groups, in alternatives of the pattern
+    :return: The pattern with named groups, so that a match gives the dict
+             of the properties at once. The next groups of a property are
+             named <property>__<n>
+    """
+    names = iter(alias_names(properties))
+    result = []
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            result.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '(' and not in_class and pattern[i + 1:i + 2] != '?':
+            c = '(?P<%s>' % next(names)
+        result.append(c)
+        i += 1
+    return ''.join(result)
+
+
+def alias_names(properties):
+    """
+    :return: The names of the groups of the properties
+    """
+    seen = {}
+    names = []
+    for name in properties:
+        count = seen.get(name, 0) + 1
+        seen[name] = count
+        names.append(name if count == 1 else '%s__%d' % (name, count))
+    return names
+
 
-    def __init__(self, log):
-        self.data = {}
+def load_event_types(path):
+    """
+    :param path: JSON file of event types: the same dicts as event_types,
+                 with the names of the conversions in types ("int", ...)
+    :return: Dict of event types
+    """
+    with open(path) as f:
+        loaded = json.load(f)
+    for name, event_type in loaded.iteritems():
+        types = event_type.get('types', {})
+        for prop, type_name in types.items():
+            if type_name not in type_converters:
+                raise ValueError(
+                    "Unknown type %s for %s of the event type %s"
+                    % (type_name, prop, name)
+                )
+            types[prop] = type_converters[type_name]
+    return loaded
 
-        #Find the type of event
-        event_type_match = event_type_pattern.match(log)
 
-        if event_type_match:
-            #parse it with it's pattern
-            event_type = event_types[event_type_match.group(1)]
-            properties_match = re.match(event_type['pattern'], log)
+# Dispatch parser of the log lines.
+# Every event type lists the headers of its lines, the text between the
+# timestamp and the first colon ("SERVICE ALERT", ...). A single compiled
+# regex on the beginning of the line rejects the other lines and finds the
+# event type, whose compiled pattern then parses the line.
+# The event_type property of an event is the name of its event type, the
+# properties listed in its tags are written as tags instead of fields.
+class LogEventParser(object):
 
-            if properties_match:
-                # Populate self.data with the event's properties
-                for i, p in enumerate(event_type['properties']):
-                    self.data[p] = properties_match.group(i+1)
+    def __init__(self, event_types):
+        """
+        :param event_types: Dict of event types, each with its headers, its
+                            pattern, the names of the groups (properties),
+                            the conversion of the properties (types) and the
+                            properties written as tags (tags)
+        """
+        self.headers = {}
+        self.tags = {}
+        for name, event_type in event_types.iteritems():
+            properties = event_type['properties']
+            try:
+                pattern = re.compile(
+                    name_groups(event_type['pattern'], properties)
+                )
+            except (re.error, StopIteration):
+                pattern = None
+            if pattern is None or pattern.groups != len(properties):
+                raise ValueError(
+                    "Invalid pattern of the event type %s, it must have a "
+                    "group for each of its %d properties"
+                    % (name, len(properties))
+                )
+            # The groups of a property in the other alternatives
+            aliases = [
+                (prop, alias) for prop, alias in
+                zip(properties, alias_names(properties)) if prop != alias
+            ]
+            entry = (name, pattern, event_type.get('types', {}).items(),
+                     aliases)
+            for header in event_type['headers']:
+                self.headers[header] = entry
+            self.tags[name] = event_type.get('tags', [])
 
-                # Convert the time to int
-                self.data['time'] = int(self.data['time'])
+        # '[1402515279] HEADER:', the longest headers first
+        self.header_pattern = None
+        if self.headers:
+            self.header_pattern = re.compile(
+                r'\[[0-9]{10}\] (%s):' % '|'.join([
+                    re.escape(h)
+                    for h in sorted(self.headers, key=len, reverse=True)
+                ])
+            )
+
+    def parse(self, log):
+        """
+        :param log: A line of the monitoring log
+        :return: Dict of the properties of the event, None if the line is
+                 not an event
+        """
+        if self.header_pattern is None:
+            return None
+        match = self.header_pattern.match(log)
+        if match is None:
+            return None
+
+        event_type, pattern, types, aliases = self.headers[match.group(1)]
+        match = pattern.match(log)
+        if match is None:
+            return None
+        data = match.groupdict()
+        for prop, alias in aliases:
+            value = data.pop(alias)
+            if data[prop] is None:
+                data[prop] = value
+        data['time'] = int(data['time'])
+        data['event_type'] = event_type
+        for name, convert in types:
+            if data.get(name) is not None:
+                data[name] = convert(data[name])
+        return data
+
+
+parser = LogEventParser(dict(
+    (name, event_types[name]) for name in default_event_types
+))
+
+
+# Class for parsing event logs
+# Populates self.data with the log type's properties
+class LogEvent:
 
-                # Convert attempts to int
-                if 'attempts' in self.data:
-                    self.data['attempts'] = int(self.data['attempts'])
+    def __init__(self, log, parser=parser):
+        self.data = parser.parse(log) or {}
 
     def __iter__(self):
         return self.data.iteritems()
@@ -30,18 +30,34 @@ to brok information of the services/hosts and events into the influxdb
 backend. http://influxdb.com/
 """
 
-import threading
+import time
 
 from shinken.basemodule import BaseModule
 from shinken.log import logger
-from shinken.misc.perfdata import PerfDatas
-from influxdb import InfluxDBClient
 
-# LogEvent is only available in shinken>2.0.3
-try:
-    from shinken.misc.logevent import LogEvent
-except ImportError:
-    from logevent import LogEvent
+from aggregate import Aggregator, AGGREGATE_FUNCTIONS
+from cache import LRUCache
+from cardinality import CardinalityGuard
+from deadletter import DeadLetterFile
+from debug import DebugSampler, debug_enabled
+from endpoint import Endpoint
+from fieldtypes import FieldTypeRegistry
+from lineprotocol import LineSerializer, make_prefix
+from logevent import LogEventParser, default_event_types, event_types, \
+    load_event_types
+from perfdata import parse_perfdata
+from pipeline import SerializerPool
+from schema import load_schema
+from point import Point
+from sharding import HashRing
+
+PERFDATA_SCHEMAS = ('measurement', 'tag', 'point')
+COMPRESSIONS = ('none', 'gzip')
+
+# Initialized instances by module name. Shinken drops the instances of
+# internal modules on reconfiguration without calling quit, the previous
+# instance is stopped when the new one is initialized.
+running_instances = {}
 
 
 # Class for the influxdb Broker
@@ -57,71 +73,463 @@ class InfluxdbBroker(BaseModule):
         self.password = getattr(modconf, 'password', 'root')
         self.database = getattr(modconf, 'database', 'database')
         self.use_https = getattr(modconf, 'use_https', '0') == '1'
+        self.verify_ssl = getattr(modconf, 'verify_ssl', '0') == '1'
+        self.connect_timeout = float(
+            getattr(modconf, 'connect_timeout', '5')
+        )
+        self.read_timeout = float(getattr(modconf, 'read_timeout', '30'))
         self.use_udp = getattr(modconf, 'use_udp', '0') == '1'
         self.udp_port = int(getattr(modconf, 'udp_port', '4444'))
+        self.compression = getattr(modconf, 'compression', 'none')
+        self.compression_level = int(
+            getattr(modconf, 'compression_level', '6')
+        )
+        if self.compression not in COMPRESSIONS:
+            raise ValueError(
+                "Unknown compression %s, expected one of %s"
+                % (self.compression, ', '.join(COMPRESSIONS))
+            )
+        if not -1 <= self.compression_level <= 9:
+            raise ValueError(
+                "Invalid compression_level %d, expected -1 to 9"
+                % self.compression_level
+            )
+
+        self.buffer_size = int(getattr(modconf, 'buffer_size', '100000'))
+        self.buffer_max_bytes = int(getattr(modconf, 'buffer_max_bytes', '0'))
+        self.buffer_overflow = getattr(
+            modconf, 'buffer_overflow', 'drop_oldest'
+        )
+
+        self.spool_dir = getattr(modconf, 'spool_dir', '')
+        self.spool_max_bytes = int(
+            getattr(modconf, 'spool_max_bytes', '104857600')
+        )
+
+        self.series_cache_size = int(
+            getattr(modconf, 'series_cache_size', '100000')
+        )
+        self.series_cache = LRUCache(self.series_cache_size)
+        self.serializer = LineSerializer(self.series_cache_size)
+
+        self.perfdata_schema = getattr(
+            modconf, 'perfdata_schema', 'measurement'
+        )
+        if self.perfdata_schema not in PERFDATA_SCHEMAS:
+            raise ValueError(
+                "Unknown perfdata_schema %s, expected one of %s"
+                % (self.perfdata_schema, ', '.join(PERFDATA_SCHEMAS))
+            )
+        self.perfdata_measurement = getattr(
+            modconf, 'perfdata_measurement', 'perfdata'
+        )
+        # Measurements of the perfdata points, for the aggregation and the
+        # low priority points of the buffer
+        self.perfdata_prefix = 'metric_'
+        if self.perfdata_schema != 'measurement':
+            self.perfdata_prefix = self.perfdata_measurement
+
+        self.perfdata_cache_size = int(
+            getattr(modconf, 'perfdata_cache_size', '0')
+        )
+        self.perfdata_cache = None
+        if self.perfdata_cache_size > 0:
+            self.perfdata_cache = LRUCache(self.perfdata_cache_size)
+        if hasattr(modconf, 'tick_limit'):
+            logger.warning(
+                "[influxdb broker] tick_limit is deprecated and ignored, "
+                "use buffer_size and buffer_overflow instead"
+            )
+
+        self.batch_size = int(getattr(modconf, 'batch_size', '5000'))
+        self.flush_interval = float(getattr(modconf, 'flush_interval', '1'))
+        self.writer_threads = int(getattr(modconf, 'writer_threads', '1'))
+        self.max_connections = int(
+            getattr(modconf, 'max_connections', self.writer_threads)
+        )
+        self.retry_backoff_min = float(
+            getattr(modconf, 'retry_backoff_min', '1')
+        )
+        self.retry_backoff_max = float(
+            getattr(modconf, 'retry_backoff_max', '60')
+        )
+        self.probe_size = int(getattr(modconf, 'probe_size', '10'))
+
+        self.dead_letter_file = getattr(modconf, 'dead_letter_file', '')
+        self.bisect_max_requests = int(
+            getattr(modconf, 'bisect_max_requests', '50')
+        )
+        self.dead_letter = None
+
+        self.field_type_check = getattr(
+            modconf, 'field_type_check', '1'
+        ) == '1'
+        self.field_type_warmup = getattr(
+            modconf, 'field_type_warmup', '0'
+        ) == '1'
+        self.field_types = None
+        if self.field_type_check:
+            self.field_types = FieldTypeRegistry()
+
+        self.state_dedup = getattr(modconf, 'state_dedup', '0') == '1'
+        self.state_heartbeat = float(
+            getattr(modconf, 'state_heartbeat', '3600')
+        )
+        self.state_cache = None
+        if self.state_dedup:
+            self.state_cache = LRUCache(self.series_cache_size)
+
+        self.aggregate_window = float(
+            getattr(modconf, 'aggregate_window', '0')
+        )
+        self.aggregate_functions = [
+            f.strip() for f in getattr(
+                modconf, 'aggregate_functions', 'min,max,mean,last'
+            ).split(',') if f.strip()
+        ]
+        for function in self.aggregate_functions:
+            if function not in AGGREGATE_FUNCTIONS:
+                raise ValueError(
+                    "Unknown aggregate function %s, expected one of %s"
+                    % (function, ', '.join(AGGREGATE_FUNCTIONS))
+                )
+        self.aggregate_raw = getattr(modconf, 'aggregate_raw', '0') == '1'
+        self.aggregator = None
+        self.reported_late = 0
+        if self.aggregate_window > 0:
+            self.aggregator = Aggregator(
+                self.aggregate_window, self.aggregate_functions,
+                self.aggregate_raw, self.perfdata_prefix
+            )
+            if self.perfdata_schema == 'point':
+                logger.warning(
+                    "[influxdb broker] The perfdata is not aggregated with "
+                    "perfdata_schema point, its points have no value field"
+                )
+
+        self.event_types = [
+            t.strip() for t in getattr(
+                modconf, 'event_types', ','.join(default_event_types)
+            ).split(',') if t.strip()
+        ]
+        self.event_types_file = getattr(modconf, 'event_types_file', '')
+        self.log_event_parser = self.make_log_event_parser()
+
+        self.schema_file = getattr(modconf, 'schema_file', '')
+        self.schema = None
+
+        self.series_limit = int(getattr(modconf, 'series_limit', '0'))
+        self.series_host_limit = int(
+            getattr(modconf, 'series_host_limit', '0')
+        )
+        self.series_overflow = getattr(modconf, 'series_overflow', 'drop')
+        self.series_guard = None
+        if self.series_limit > 0 or self.series_host_limit > 0:
+            self.series_guard = CardinalityGuard(
+                self.series_limit, self.series_host_limit,
+                self.series_overflow, self.perfdata_prefix
+            )
 
-        self._lock = threading.Lock()
-        self.buffer = []
-        self.ticks = 0
-        self.tick_limit = int(getattr(modconf, 'tick_limit', '300'))
+        self.debug_sampling = int(getattr(modconf, 'debug_sampling', '1'))
+        self.debug_sampler = DebugSampler(self.debug_sampling)
+
+        self.serializer_processes = int(
+            getattr(modconf, 'serializer_processes', '0')
+        )
+        self.pipeline = None
+
+        self.endpoints = self.parse_endpoints(
+            getattr(modconf, 'endpoints', '')
+        )
+        self.endpoint_mode = getattr(modconf, 'endpoint_mode', 'replicate')
+        if self.endpoint_mode not in ('replicate', 'shard'):
+            raise ValueError(
+                "Unknown endpoint_mode %s, expected replicate or shard"
+                % self.endpoint_mode
+            )
+        self.ring = HashRing(self.endpoints, [e.name for e in self.endpoints])
+
+    def make_log_event_parser(self):
+        """
+        :return: LogEventParser of the enabled event types, the types of
+                 event_types_file are added to the built-in ones
+        """
+        known = dict(event_types)
+        if self.event_types_file:
+            known.update(load_event_types(self.event_types_file))
+        for name in self.event_types:
+            if name not in known:
+                raise ValueError(
+                    "Unknown event type %s, expected one of %s"
+                    % (name, ', '.join(sorted(known)))
+                )
+        return LogEventParser(
+            dict((name, known[name]) for name in self.event_types)
+        )
+
+    def parse_endpoints(self, endpoints):
+        """
+        :param endpoints: Comma separated list of host[:port], host and port
+                          are used when empty
+        :return: List of Endpoint
+        """
+        result = []
+        for endpoint in endpoints.split(','):
+            endpoint = endpoint.strip()
+            if not endpoint:
+                continue
+            if ':' in endpoint:
+                host, port = endpoint.rsplit(':', 1)
+                port = int(port)
+            else:
+                host, port = endpoint, self.port
+            result.append(Endpoint(host, port, self, self.serializer))
+        if not result:
+            result.append(
+                Endpoint(self.host, self.port, self, self.serializer)
+            )
+        return result
 
     def extend_buffer(self, other):
-        with self._lock:
-            self.buffer.extend(other)
+        if self.aggregator is not None:
+            other = self.aggregator.add(other)
+        self.dispatch_points(other)
+
+    # Place the attributes as set by the schema, keep the series within
+    # the limits, convert the fields to their known types, then give the
+    # points to every endpoint in replicate mode, or to the endpoint owning
+    # their (host_name, measurement) in shard mode
+    def dispatch_points(self, other):
+        if self.schema is not None:
+            other = self.schema.apply(other)
+        if self.series_guard is not None:
+            other = self.series_guard.check(other)
+        if self.field_types is not None:
+            other = self.field_types.check(other)
+
+        if self.endpoint_mode == 'replicate' or len(self.endpoints) == 1:
+            for endpoint in self.endpoints:
+                endpoint.extend(other)
+            return
+
+        for endpoint, points in self.shard_points(other).iteritems():
+            endpoint.extend(points)
+
+    def shard_points(self, points):
+        """
+        :return: Dict of the points owned by each endpoint
+        """
+        shards = {}
+        for point in points:
+            endpoint = self.ring.get_node(
+                (point.tags.get('host_name') or '') + point.measurement
+            )
+            shards.setdefault(endpoint, []).append(point)
+        return shards
+
+    def serialize_points(self, points):
+        """
+        :param points: List of Point
+        :return: List of (endpoint index, body), the index is None when the
+                 body goes to every endpoint
+        """
+        if self.schema is not None:
+            points = self.schema.apply(points)
+        # Each process checks the types with its copy of the registry, made
+        # after the warmup
+        if self.field_types is not None:
+            points = self.field_types.check(points)
+        if self.endpoint_mode == 'replicate' or len(self.endpoints) == 1:
+            return [(None, self.serializer.serialize(points))]
+
+        return [
+            (self.endpoints.index(endpoint), self.serializer.serialize(shard))
+            for endpoint, shard in self.shard_points(points).iteritems()
+        ]
+
+    # Give the bodies made by serialize_points to their endpoints
+    def dispatch_bodies(self, bodies):
+        for index, body in bodies:
+            if not body:
+                continue
+            if index is None:
+                for endpoint in self.endpoints:
+                    endpoint.extend_body(body)
+            else:
+                self.endpoints[index].extend_body(body)
 
     # Called by Broker so we can do init stuff
     # Conf from arbiter!
     def init(self):
         logger.info(
-            "[influxdb broker] I init the %s server connection to %s:%d" %
-            (self.get_name(), str(self.host), self.port)
+            "[influxdb broker] I init the %s server connection to %s (%s)" %
+            (self.get_name(), ', '.join([e.name for e in self.endpoints]),
+             self.endpoint_mode)
         )
 
-        self.db = InfluxDBClient(
-            self.host, self.port, self.user, self.password, self.database,
-            ssl=self.use_https, use_udp=self.use_udp,
-            udp_port=self.udp_port, timeout=None
-        )
+        # Stop the threads and processes of the instance we replace, and
+        # release its spool
+        previous = running_instances.get(self.get_name())
+        if previous is not None and previous is not self:
+            logger.info(
+                "[influxdb broker] Stopping the previous %s instance"
+                % self.get_name()
+            )
+            previous.quit()
+        running_instances[self.get_name()] = self
+
+        if self.dead_letter_file:
+            self.dead_letter = DeadLetterFile(self.dead_letter_file)
+        if self.schema_file:
+            self.schema = load_schema(self.schema_file)
+
+        for endpoint in self.endpoints:
+            endpoint.init()
+            if self.field_types is not None and self.field_type_warmup:
+                self.warm_field_types(endpoint)
+
+        # The processes are forked before any thread of the module starts,
+        # and after the warmup so they know the field types
+        if self.serializer_processes > 0:
+            if self.aggregator is not None or self.series_guard is not None:
+                logger.warning(
+                    "[influxdb broker] serializer_processes can not be used "
+                    "with aggregate_window or the series limits, the "
+                    "perfdata is parsed by the broker"
+                )
+            else:
+                # The checks waiting for the processes are bounded like the
+                # buffer
+                self.pipeline = SerializerPool(
+                    self, self.serializer_processes,
+                    max_checks=self.buffer_size
+                )
+                self.pipeline.start()
+
+        for endpoint in self.endpoints:
+            endpoint.start_writers()
+
+    # Learn the types of the fields already in the database
+    def warm_field_types(self, endpoint):
+        try:
+            count = self.field_types.warm(
+                endpoint.db.query('SHOW FIELD KEYS')
+            )
+        except Exception as e:
+            logger.warning(
+                "[influxdb broker] Could not get the field types from %s: %s"
+                % (endpoint.name, e)
+            )
+        else:
+            logger.info(
+                "[influxdb broker] Got %d field types from %s"
+                % (count, endpoint.name)
+            )
+
+    # Called by the modules manager when the broker stops
+    def quit(self):
+        if running_instances.get(self.get_name()) is self:
+            del running_instances[self.get_name()]
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        if self.aggregator is not None:
+            self.dispatch_points(self.aggregator.close())
+        if self.series_guard is not None:
+            self.dispatch_points(self.series_guard.report(int(time.time())))
+        for endpoint in self.endpoints:
+            endpoint.quit()
 
     def get_check_result_perfdata_points(self, perf_data, timestamp, tags={}):
         """
         :param perf_data: Perf data of the brok
         :param timestamp: Timestamp of the check result
-        :param tags: Tags for the point
+        :param tags: Tags for the point, only made of the host_name and
+                     service_description
         :return: List of perfdata points
         """
-        points = []
-        metrics = PerfDatas(perf_data).metrics
-
-        for e in metrics.values():
-            fields = {}
-            fields_mappings = [
-                ('value', 'value'),
-                ('uom', 'unit'),
-                ('warning', 'warning'),
-                ('critical', 'critical'),
-                ('min', 'min'),
-                ('max', 'max')
-            ]
-            for mapping in fields_mappings:
-                value = getattr(e, mapping[0], None)
-                if value is not None:
-                    if isinstance(value, (int, long)):
-                        value = float(value)
-                    fields[mapping[1]] = value
-
-            if fields:
-                point = {
-                    "measurement": 'metric_%s' % self.illegal_char.sub('_',
-                                                                       e.name),
-                    "time": timestamp,
-                    "fields": fields,
-                    "tags": tags,
-                }
+        host_name = tags.get('host_name')
+        service_description = tags.get('service_description')
+
+        # Same perfdata as the previous check, only the time changes
+        if self.perfdata_cache is not None:
+            last = self.perfdata_cache.get((host_name, service_description))
+            if last is not None and last[0] == perf_data:
+                return [point.at(timestamp) for point in last[1]]
+
+        metrics = parse_perfdata(perf_data)
+        if self.perfdata_schema == 'point':
+            points = self.get_perfdata_point(metrics, timestamp, tags)
+        else:
+            points = []
+            for name, fields in metrics.iteritems():
+                # The measurement name and the escaped series only depend
+                # on the host, the service and the metric name
+                key = (host_name, service_description, name)
+                series = self.series_cache.get(key)
+                if series is None:
+                    series = self.get_metric_series(name, tags)
+                    self.series_cache.set(key, series)
+
+                point = Point(
+                    series[0], series[2], timestamp, fields, series[1]
+                )
                 points.append(point)
 
+        if self.perfdata_cache is not None:
+            self.perfdata_cache.set(
+                (host_name, service_description), (perf_data, points)
+            )
+
         return points
 
+    def get_metric_series(self, name, tags):
+        """
+        :param name: Name of a metric in the perfdata
+        :param tags: Tags of the check result
+        :return: (measurement, escaped series, tags) of the metric points
+        """
+        metric = self.illegal_char.sub('_', name)
+        if self.perfdata_schema == 'tag':
+            measurement = self.perfdata_measurement
+            tags = dict(tags, metric=metric)
+        else:
+            measurement = 'metric_%s' % metric
+        return measurement, make_prefix(measurement, tags), tags
+
+    # All the metrics of a check result in the fields of a single point,
+    # the value field of a metric is named after the metric and its other
+    # fields are named metric.field. The sanitized metric names have no
+    # dot, so the names of two metrics can not collide
+    def get_perfdata_point(self, metrics, timestamp, tags):
+        if not metrics:
+            return []
+        fields = {}
+        for name, metric in metrics.iteritems():
+            name = self.illegal_char.sub('_', name)
+            for field, value in metric.iteritems():
+                if field == 'value':
+                    fields[name] = value
+                else:
+                    fields['%s.%s' % (name, field)] = value
+
+        key = (tags.get('host_name'), tags.get('service_description'))
+        prefix = self.series_cache.get(key)
+        if prefix is None:
+            prefix = make_prefix(self.perfdata_measurement, tags)
+            self.series_cache.set(key, prefix)
+        return [Point(self.perfdata_measurement, tags, timestamp, fields,
+                      prefix)]
+
+    # The perfdata points, unless they are made by the serializer processes
+    def get_perfdata_points(self, perf_data, timestamp, tags):
+        if self.pipeline is not None:
+            self.pipeline.put(perf_data, timestamp, tags)
+            return []
+        return self.get_check_result_perfdata_points(
+            perf_data, timestamp, tags
+        )
+
     @staticmethod
     def get_state_update_points(data, tags={}):
         """
@@ -134,17 +542,17 @@ class InfluxdbBroker(BaseModule):
                 data['state_type'] != data['last_state_type']:
 
             points.append(
-                {
-                    "measurement": "EVENT",
-                    "tags": tags,
-                    "time": data['last_chk'],
-                    "fields": {
+                Point(
+                    "EVENT",
+                    tags,
+                    data['last_chk'],
+                    {
                         "event_type": 'ALERT',
                         "state": data['state'],
                         "state_type": data['state_type'],
                         "output": data['output'],
-                    },
-                }
+                    }
+                )
             )
 
         return points
@@ -159,26 +567,49 @@ class InfluxdbBroker(BaseModule):
         points = []
 
         points.append(
-            {
-                "measurement": name,
-                "tags": tags,
-                "time": data['last_chk'],
-                "fields": {
+            Point(
+                name,
+                tags,
+                data['last_chk'],
+                {
                     "state_type": data['state_type'],
                     'acknowledged': int(data['problem_has_been_acknowledged']),
                     "output": data['output'],
                     "state": data['state_id'],
                     "last_check": data['last_chk'],
                     "last_state_change": data['last_state_change']
-                },
-            }
+                }
+            )
         )
 
         return points
 
+    def get_changed_state_points(self, data, name, tags={}):
+        """
+        :param name: HOST_STATE or SERVICE_STATE
+        :return: The state points, only if the state changed since the last
+                 written point or if it is older than state_heartbeat
+        """
+        if self.state_cache is None:
+            return self.get_state_points(data, name, tags)
+
+        key = (name, tags.get('host_name'), tags.get('service_description'))
+        state = (
+            data['state_id'], data['state_type'],
+            data['problem_has_been_acknowledged'], data['output']
+        )
+        last = self.state_cache.get(key)
+        if last is not None and last[0] == state and (
+                self.state_heartbeat <= 0 or
+                data['last_chk'] - last[1] < self.state_heartbeat):
+            return []
+
+        self.state_cache.set(key, (state, data['last_chk']))
+        return self.get_state_points(data, name, tags)
+
     # A service check result brok has just arrived,
     # we UPDATE data info with this
-    def manage_service_check_result_brok(self, b):
+    def get_service_check_result_brok_points(self, b):
         data = b.data
 
         tags = {
@@ -189,10 +620,10 @@ class InfluxdbBroker(BaseModule):
         post_data = []
 
         post_data.extend(
-            self.get_check_result_perfdata_points(
+            self.get_perfdata_points(
                 b.data['perf_data'],
                 b.data['last_chk'],
-                tags=tags
+                tags
             )
         )
 
@@ -201,19 +632,13 @@ class InfluxdbBroker(BaseModule):
         )
 
         post_data.extend(
-            self.get_state_points(b.data, "SERVICE_STATE", tags)
+            self.get_changed_state_points(b.data, "SERVICE_STATE", tags)
         )
 
-        try:
-            logger.debug(
-                "[influxdb broker] Generated points: %s" % str(post_data))
-        except UnicodeEncodeError:
-            pass
-
-        self.extend_buffer(post_data)
+        return post_data
 
     # A host check result brok has just arrived, we UPDATE data info with this
-    def manage_host_check_result_brok(self, b):
+    def get_host_check_result_brok_points(self, b):
         data = b.data
         host_name = data['host_name']
 
@@ -225,10 +650,10 @@ class InfluxdbBroker(BaseModule):
         post_data = []
 
         post_data.extend(
-            self.get_check_result_perfdata_points(
+            self.get_perfdata_points(
                 b.data['perf_data'],
                 b.data['last_chk'],
-                tags=tags
+                tags
             )
         )
 
@@ -240,18 +665,12 @@ class InfluxdbBroker(BaseModule):
         )
 
         post_data.extend(
-            self.get_state_points(b.data, "HOST_STATE", tags)
+            self.get_changed_state_points(b.data, "HOST_STATE", tags)
         )
 
-        try:
-            logger.debug(
-                "[influxdb broker] Generated points: %s" % str(post_data))
-        except UnicodeEncodeError:
-            pass
-
-        self.extend_buffer(post_data)
+        return post_data
 
-    def manage_unknown_host_check_result_brok(self, b):
+    def get_unknown_host_check_result_brok_points(self, b):
         data = b.data
 
         tags = {
@@ -261,22 +680,16 @@ class InfluxdbBroker(BaseModule):
         post_data = []
 
         post_data.extend(
-            self.get_check_result_perfdata_points(
+            self.get_perfdata_points(
                 b.data['perf_data'],
                 b.data['time_stamp'],
-                tags=tags
+                tags
             )
         )
 
-        try:
-            logger.debug(
-                "[influxdb broker] Generated points: %s" % str(post_data))
-        except UnicodeEncodeError:
-            pass
-
-        self.extend_buffer(post_data)
+        return post_data
 
-    def manage_unknown_service_check_result_brok(self, b):
+    def get_unknown_service_check_result_brok_points(self, b):
         data = b.data
 
         tags = {
@@ -287,92 +700,129 @@ class InfluxdbBroker(BaseModule):
         post_data = []
 
         post_data.extend(
-            self.get_check_result_perfdata_points(
+            self.get_perfdata_points(
                 b.data['perf_data'],
                 b.data['time_stamp'],
-                tags=tags
+                tags
             )
         )
 
-        try:
-            logger.debug(
-                "[influxdb broker] Generated points: %s" % str(post_data))
-        except UnicodeEncodeError:
-            pass
-
-        self.extend_buffer(post_data)
+        return post_data
 
     # A log brok has arrived, we UPDATE data info with this
-    def manage_log_brok(self, b):
-        log = b.data['log']
-        event = LogEvent(log)
+    def get_log_brok_points(self, b):
+        event = self.log_event_parser.parse(b.data['log'])
 
-        if len(event) > 0:
-            # include service_description in the table name if present
-            if 'service_desc' in event and event['service_desc'] is not None:
-                service_description = event['service_desc']
-            else:
-                service_description = '_self_'
-
-            point = {
-                "measurement": "EVENT",
-                "time": event['time'],
-                "fields": {},
-                "tags": {
-                    "host_name": event['hostname'],
-                    "service_description": service_description,
-                    "event_type": event['event_type'],
-                }
-            }
+        if event is None:
+            return []
 
-            # Add each property of the service in the point
-            for prop in [
-                prop for prop in event
-                if prop[0] not in ['hostname', 'event_type', 'service_desc']
-            ]:
-                point['fields'][prop[0]] = prop[1]
+        # include service_description in the table name if present
+        if event.get('service_desc') is not None:
+            service_description = event['service_desc']
+        else:
+            service_description = '_self_'
 
-            try:
-                logger.debug(
-                    "[influxdb broker] Generated points: %s" % str([point]))
-            except UnicodeEncodeError:
-                pass
+        tags = {
+            "service_description": service_description,
+            "event_type": event['event_type'],
+        }
+        # Some events have no host (timeperiod transitions, ...)
+        if event.get('hostname') is not None:
+            tags['host_name'] = event['hostname']
+
+        # Add each property of the service in the point
+        fields = dict(event)
+        for prop in ('hostname', 'event_type', 'service_desc'):
+            fields.pop(prop, None)
+        for prop in self.log_event_parser.tags[event['event_type']]:
+            value = fields.pop(prop, None)
+            if value is not None:
+                tags[prop] = value
+
+        return [Point("EVENT", tags, event['time'], fields)]
+
+    # Called by the broker for each brok
+    def manage_service_check_result_brok(self, b):
+        self.add_points(self.get_service_check_result_brok_points(b))
 
-            self.extend_buffer([point])
+    def manage_host_check_result_brok(self, b):
+        self.add_points(self.get_host_check_result_brok_points(b))
 
-    def hook_tick(self, brok):
+    def manage_unknown_host_check_result_brok(self, b):
+        self.add_points(self.get_unknown_host_check_result_brok_points(b))
 
-        if self.ticks >= self.tick_limit:
-            with self._lock:
-                buffer = self.buffer
-                self.buffer = []
-            logger.error(
-                "[influxdb broker] Buffering ticks exceeded. "
-                "Freeing buffer, lost %d entries" % len(buffer)
-            )
-            self.ticks = 0
+    def manage_unknown_service_check_result_brok(self, b):
+        self.add_points(
+            self.get_unknown_service_check_result_brok_points(b)
+        )
+
+    def manage_log_brok(self, b):
+        self.add_points(self.get_log_brok_points(b))
 
-        if len(self.buffer) > 0:
-            with self._lock:
-                buffer = self.buffer
-                self.buffer = []
-            try:
+    def manage_broks(self, broks):
+        """
+        Manage a list of broks at once, the points of all the broks are
+        buffered together
+        :param broks: List of Brok, the unknown types are ignored
+        """
+        points = []
+        getters = {}
+        for b in broks:
+            get_points = getters.get(b.type, False)
+            if get_points is False:
+                get_points = getters[b.type] = getattr(
+                    self, 'get_%s_brok_points' % b.type, None
+                )
+            if get_points is not None:
+                b.prepare()
+                points.extend(get_points(b))
+        self.add_points(points)
+
+    def add_points(self, points):
+        if not points:
+            return
+        if debug_enabled():
+            sampled = self.debug_sampler.sample(points)
+            if sampled:
                 try:
                     logger.debug(
-                        "[influxdb broker] Writing points: %s" % str(buffer))
+                        "[influxdb broker] Generated points: %s"
+                        % str(sampled))
                 except UnicodeEncodeError:
                     pass
-                self.db.write_points(buffer, time_precision='s')
-            except Exception as e:
-                self.ticks += 1
-                logger.error("[influxdb broker] %s" % e)
-                logger.error(
-                    "[influxdb broker] Sending data Failed. "
-                    "Buffering state : %s / %s"
-                    % (self.ticks, self.tick_limit)
-                )
-                with self._lock:
-                    buffer.extend(self.buffer)
-                    self.buffer = buffer
-            else:
-                self.ticks = 0
+
+        self.extend_buffer(points)
+
+    # The broker tick never writes to influxdb itself, it only makes sure
+    # the writer threads are running and buffers the closed windows
+    def hook_tick(self, brok):
+        for endpoint in self.endpoints:
+            endpoint.start_writers()
+        if self.pipeline is not None:
+            self.pipeline.flush()
+        if self.series_guard is not None:
+            self.dispatch_points(self.series_guard.report(int(time.time())))
+
+        # Write the windows of the series which stopped reporting, one
+        # window after their end. The samples arriving later are dropped.
+        if self.aggregator is not None:
+            self.dispatch_points(self.aggregator.close(
+                time.time() - self.aggregate_window
+            ))
+            self.report_late_samples()
+
+    # Log the samples dropped by the aggregator since the last report
+    def report_late_samples(self):
+        late = self.aggregator.late - self.reported_late
+        if late > 0:
+            self.reported_late = self.aggregator.late
+            logger.warning(
+                "[influxdb broker] Dropped %d perfdata samples older than "
+                "their aggregation window, %d in total"
+                % (late, self.aggregator.late)
+            )
+
+    # Send the buffers to influxdb now
+    def flush(self):
+        for endpoint in self.endpoints:
+            endpoint.flush()
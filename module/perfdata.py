@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Single pass perfdata parser giving the same metrics as
+shinken.misc.perfdata.PerfDatas, directly as influxdb fields.
+"""
+
+import re
+
+# Same tokens as PerfDatas ('label=\S+'), parsed in the same match.
+# When the value can not be parsed, the second alternative still consumes
+# the token so the next metric starts at the same place as in PerfDatas.
+perfdata_pattern = re.compile(
+    r'([^=]+)=(?:'
+    r'([\d\.\-\+eE]+)([\w\/%]*)'
+    r';?([\d\.\-\+eE:~@]+)?;?([\d\.\-\+eE:~@]+)?'
+    r';?([\d\.\-\+eE]+)?;?([\d\.\-\+eE]+)?\S*'
+    r'|\S+)'
+)
+thresholds = (('warning', 4), ('critical', 5), ('min', 6), ('max', 7))
+infinity = float('inf')
+
+
+def to_float(value):
+    """
+    :return: The value as a float, None if it is not a finite number
+    """
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        return None
+    if value in (infinity, -infinity):
+        return None
+    return value
+
+
+def parse_perfdata(perf_data):
+    """
+    :param perf_data: Perf data of a check result
+    :return: Dict of the fields of each metric, by metric name
+    """
+    metrics = {}
+    if not perf_data:
+        return metrics
+
+    for match in perfdata_pattern.finditer(perf_data):
+        name = match.group(1).lstrip()
+        if not name or match.group(2) is None:
+            continue
+
+        uom = match.group(3)
+        fields = {'unit': uom}
+        value = to_float(match.group(2))
+        if value is not None:
+            fields['value'] = value
+        if uom == '%':
+            fields['min'] = 0.0
+            fields['max'] = 100.0
+            limits = thresholds[:2]
+        else:
+            limits = thresholds
+        for field, group in limits:
+            value = to_float(match.group(group))
+            if value is not None:
+                fields[field] = value
+
+        metrics[name.replace("'", "")] = fields
+
+    return metrics
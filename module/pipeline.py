@@ -0,0 +1,189 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import multiprocessing
+import threading
+from Queue import Full
+
+from shinken.log import logger
+
+from lineprotocol import LineSerializer
+from sharding import hash_key
+
+
+# The process is forked while the writer threads run, the locks they held
+# at that time are never released in the copy. The logging locks and the
+# serializer, which the writers use, are replaced.
+def reset_after_fork(broker):
+    logging._lock = threading.RLock()
+    for handler in logger.handlers + logging.getLogger().handlers:
+        handler.createLock()
+    broker.serializer = LineSerializer(broker.series_cache_size)
+
+
+# Main loop of a serializer process.
+# `broker` is the copy of the broker made by fork, its caches are only used
+# by this process.
+def serialize_worker(broker, inbox, outbox):
+    reset_after_fork(broker)
+    while True:
+        checks = inbox.get()
+        if checks is None:
+            break
+        points = []
+        for perf_data, timestamp, tags in checks:
+            points.extend(broker.get_check_result_perfdata_points(
+                perf_data, timestamp, tags
+            ))
+        outbox.put(broker.serialize_points(points))
+        invalid = broker.serializer.pop_invalid()
+        if invalid > 0:
+            logger.error(
+                "[influxdb broker] Could not serialize %d perfdata points "
+                "(invalid names or values), %d in total"
+                % (invalid, broker.serializer.invalid)
+            )
+
+
+# Pool of processes parsing the perfdata and serializing the points.
+# The checks of a host and service always go to the same process and each
+# process sends back its bodies in order, so the points of a series keep
+# their order. The bodies are handed to the endpoints by a thread of the
+# broker process.
+# At most max_checks checks wait for the processes, the batches sent to a
+# late process are dropped and their checks counted in self.dropped. A dead
+# process is replaced on the next flush.
+class SerializerPool(object):
+
+    def __init__(self, broker, processes, batch_size=500, max_checks=0):
+        """
+        :param broker: The InfluxdbBroker, copied in every process
+        :param processes: Number of processes
+        :param batch_size: Number of checks sent to a process at once
+        :param max_checks: Maximum number of checks waiting for the
+                           processes, 0 for no limit
+        """
+        self.broker = broker
+        self.processes = processes
+        self.batch_size = batch_size
+        # Batches waiting for each process
+        self.queue_size = 0
+        if max_checks > 0:
+            self.queue_size = max(1, max_checks // (batch_size * processes))
+        self.pending = [[] for _ in range(processes)]
+        self.inboxes = []
+        self.workers = []
+        self.outbox = None
+        self.collector = None
+        self.dropped = 0
+        self.reported_dropped = 0
+
+    # Must be called before the broker starts its threads, they are not
+    # copied in the processes
+    def start(self):
+        self.outbox = multiprocessing.Queue()
+        self.inboxes = [None] * self.processes
+        self.workers = [None] * self.processes
+        for index in range(self.processes):
+            self.start_worker(index)
+
+        self.collector = threading.Thread(
+            target=self.collect, name='influxdb-collector'
+        )
+        self.collector.daemon = True
+        self.collector.start()
+
+    def start_worker(self, index):
+        inbox = multiprocessing.Queue(self.queue_size)
+        worker = multiprocessing.Process(
+            target=serialize_worker, name='influxdb-serializer-%d' % index,
+            args=(self.broker, inbox, self.outbox)
+        )
+        worker.daemon = True
+        worker.start()
+        self.inboxes[index] = inbox
+        self.workers[index] = worker
+
+    def put(self, perf_data, timestamp, tags):
+        index = hash_key(
+            '%s;%s' % (tags.get('host_name'), tags.get('service_description'))
+        ) % self.processes
+        pending = self.pending[index]
+        pending.append((perf_data, timestamp, tags))
+        if len(pending) >= self.batch_size:
+            self.send(index)
+
+    def send(self, index):
+        if self.pending[index]:
+            try:
+                self.inboxes[index].put(self.pending[index], False)
+            except Full:
+                self.dropped += len(self.pending[index])
+            self.pending[index] = []
+
+    # Send the checks waiting for a full batch, called at every tick
+    def flush(self):
+        self.check_workers()
+        for index in range(self.processes):
+            self.send(index)
+        dropped = self.dropped - self.reported_dropped
+        if dropped > 0:
+            self.reported_dropped = self.dropped
+            logger.error(
+                "[influxdb broker] The serializer processes are late, lost "
+                "the perfdata of %d checks, %d in total"
+                % (dropped, self.dropped)
+            )
+
+    # Replace the dead processes
+    def check_workers(self):
+        for index, worker in enumerate(self.workers):
+            if not worker.is_alive():
+                logger.error(
+                    "[influxdb broker] Serializer process %d died (exit code "
+                    "%s), the checks sent to it are lost. Restarting it"
+                    % (index, worker.exitcode)
+                )
+                self.start_worker(index)
+
+    def stop(self):
+        self.flush()
+        for inbox, worker in zip(self.inboxes, self.workers):
+            if worker.is_alive():
+                inbox.put(None)
+        for worker in self.workers:
+            worker.join()
+        if self.collector is not None:
+            self.outbox.put(None)
+            self.collector.join()
+        self.inboxes = []
+        self.workers = []
+
+    def collect(self):
+        while True:
+            bodies = self.outbox.get()
+            if bodies is None:
+                break
+            try:
+                self.broker.dispatch_bodies(bodies)
+            except Exception as e:
+                logger.error("[influxdb broker] Collector error: %s" % e)
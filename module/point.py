@@ -0,0 +1,112 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tuples of field names are shared by all the points having the same fields
+field_keys_cache = {}
+field_keys_cache_size = 10000
+
+
+def intern_keys(keys):
+    shared = field_keys_cache.get(keys)
+    if shared is None:
+        if len(field_keys_cache) >= field_keys_cache_size:
+            field_keys_cache.clear()
+        field_keys_cache[keys] = shared = keys
+    return shared
+
+
+# A point to be written in influxdb.
+# The fields are kept as a shared tuple of sorted names and a tuple of
+# values, which is much smaller than a dict. The tags dict is shared by all
+# the points of a check result, it must not be modified.
+# The prefix is the escaped 'measurement,tags' part of the line protocol,
+# when it is already known.
+class Point(object):
+
+    __slots__ = ('measurement', 'tags', 'time', 'field_keys', 'field_values',
+                 'prefix')
+
+    def __init__(self, measurement, tags, time, fields, prefix=None):
+        """
+        :param measurement: Name of the measurement
+        :param tags: Tags of the point
+        :param time: Timestamp in seconds
+        :param fields: Dict of the fields, None values are ignored
+        :param prefix: Escaped measurement and tags, computed if None
+        """
+        self.measurement = measurement
+        self.tags = tags
+        self.time = time
+        self.fields = fields
+        self.prefix = prefix
+
+    def get_fields(self):
+        return dict(zip(self.field_keys, self.field_values))
+
+    def set_fields(self, fields):
+        items = sorted(
+            [(k, v) for k, v in fields.iteritems() if v is not None]
+        )
+        self.field_keys = intern_keys(tuple([k for k, v in items]))
+        self.field_values = tuple([v for k, v in items])
+
+    fields = property(get_fields, set_fields)
+
+    def at(self, time):
+        """
+        :return: A copy of the point with another timestamp
+        """
+        point = Point.__new__(Point)
+        point.measurement = self.measurement
+        point.tags = self.tags
+        point.time = time
+        point.field_keys = self.field_keys
+        point.field_values = self.field_values
+        point.prefix = self.prefix
+        return point
+
+    def to_dict(self):
+        return {
+            'measurement': self.measurement,
+            'tags': self.tags,
+            'time': self.time,
+            'fields': self.fields,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Point):
+            return NotImplemented
+        return self.measurement == other.measurement and \
+            self.time == other.time and \
+            self.tags == other.tags and \
+            self.field_keys == other.field_keys and \
+            self.field_values == other.field_values
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __repr__(self):
+        return 'Point(%r, %r, %r, %r)' % (
+            self.measurement, self.tags, self.time, self.fields
+        )
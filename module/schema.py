@@ -0,0 +1,146 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from point import Point
+
+schema_keys = ('tags', 'fields', 'drop')
+
+
+# Placement of the attributes of the points of each measurement.
+# The mapping of a measurement lists the attributes written as tags, the
+# ones written as fields and the ones dropped, the others are left where
+# they are. A measurement name ending with '*' is a prefix, the exact names
+# are used first, then the longest prefix.
+class Schema(object):
+
+    def __init__(self, mappings):
+        """
+        :param mappings: Dict of {'tags': [...], 'fields': [...],
+                         'drop': [...]} by measurement
+        """
+        self.exact = {}
+        self.prefixes = []
+        for measurement, mapping in mappings.iteritems():
+            compiled = self.compile(measurement, mapping)
+            if measurement.endswith('*'):
+                self.prefixes.append((measurement[:-1], compiled))
+            else:
+                self.exact[measurement] = compiled
+        self.prefixes.sort(key=lambda e: len(e[0]), reverse=True)
+        self.mappings = {}
+
+    @staticmethod
+    def compile(measurement, mapping):
+        if not isinstance(mapping, dict):
+            raise ValueError(
+                "The schema of %s must be a dict of %s"
+                % (measurement, ', '.join(schema_keys))
+            )
+        for key in mapping:
+            if key not in schema_keys:
+                raise ValueError(
+                    "Unknown key %s in the schema of %s, expected %s"
+                    % (key, measurement, ', '.join(schema_keys))
+                )
+        compiled = []
+        seen = set()
+        for key in schema_keys:
+            names = mapping.get(key, [])
+            if not isinstance(names, list) or \
+                    not all(isinstance(n, basestring) for n in names):
+                raise ValueError(
+                    "%s of the schema of %s must be a list of names"
+                    % (key, measurement)
+                )
+            for name in names:
+                if name in seen:
+                    raise ValueError(
+                        "%s is in several lists of the schema of %s"
+                        % (name, measurement)
+                    )
+                seen.add(name)
+            compiled.append(frozenset(names))
+        return tuple(compiled)
+
+    def get_mapping(self, measurement):
+        """
+        :return: (tags, fields, drop) sets of the measurement, None if its
+                 points are left unchanged
+        """
+        try:
+            return self.mappings[measurement]
+        except KeyError:
+            pass
+        mapping = self.exact.get(measurement)
+        if mapping is None:
+            for prefix, compiled in self.prefixes:
+                if measurement.startswith(prefix):
+                    mapping = compiled
+                    break
+        self.mappings[measurement] = mapping
+        return mapping
+
+    def apply(self, points):
+        """
+        :param points: List of Point
+        :return: The points with their attributes moved, the points left
+                 without fields are dropped
+        """
+        result = []
+        for point in points:
+            mapping = self.get_mapping(point.measurement)
+            if mapping is None:
+                result.append(point)
+                continue
+            to_tags, to_fields, drop = mapping
+
+            fields = point.fields
+            tags = {}
+            for key, value in point.tags.iteritems():
+                if key in to_fields:
+                    if value is not None:
+                        fields.setdefault(key, value)
+                elif key not in drop:
+                    tags[key] = value
+            for key in to_tags:
+                value = fields.pop(key, None)
+                if value is not None:
+                    tags[key] = value if isinstance(value, basestring) \
+                        else str(value)
+            for key in drop:
+                fields.pop(key, None)
+
+            if fields:
+                result.append(
+                    Point(point.measurement, tags, point.time, fields)
+                )
+        return result
+
+
+def load_schema(path):
+    """
+    :param path: JSON file of the mappings by measurement
+    :return: Schema
+    """
+    with open(path) as f:
+        return Schema(json.load(f))
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import zlib
+
+
+def hash_key(key):
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return zlib.crc32(key) & 0xffffffff
+
+
+# Consistent hashing of keys on nodes.
+# Every node is placed `replicas` times on the ring, a key belongs to the
+# first node after its hash. Adding or removing a node only moves the keys
+# of that node.
+class HashRing(object):
+
+    def __init__(self, nodes, names, replicas=100):
+        """
+        :param nodes: The objects returned by get_node
+        :param names: Names of the nodes, their position on the ring only
+                      depends on them
+        """
+        ring = []
+        for node, name in zip(nodes, names):
+            for i in range(replicas):
+                ring.append((hash_key('%s-%d' % (name, i)), node))
+        ring.sort(key=lambda e: e[0])
+        self._hashes = [e[0] for e in ring]
+        self._nodes = [e[1] for e in ring]
+
+    def get_node(self, key):
+        index = bisect.bisect(self._hashes, hash_key(key))
+        if index == len(self._hashes):
+            index = 0
+        return self._nodes[index]
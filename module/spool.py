@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import fcntl
+import os
+import struct
+import threading
+
+from shinken.log import logger
+
+# Every record is prefixed by its length
+record_header = struct.Struct('>I')
+segment_suffix = '.seg'
+cursor_name = 'cursor'
+lock_name = 'lock'
+
+
+# Raised when another spool already uses the directory
+class SpoolLocked(Exception):
+    pass
+
+
+# Append-only on-disk queue of records (byte strings).
+# Records are written in segment files of about segment_bytes. The oldest
+# segment is read from the offset saved in the cursor file, so the records
+# are replayed in order, even after a restart. Fully read segments are
+# deleted. When the spool grows over max_bytes (0 means no limit), the
+# oldest segments are deleted and their size is counted in dropped_bytes.
+# A directory is used by a single spool at a time, it is locked until the
+# spool is closed.
+class Spool(object):
+
+    def __init__(self, directory, max_bytes=0, segment_bytes=8388608):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.dropped_bytes = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._lock_file = open(os.path.join(directory, lock_name), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            self._lock_file.close()
+            raise SpoolLocked(
+                "%s is already used by another spool" % directory
+            )
+
+        self._lock = threading.Lock()
+        self.segments = sorted(
+            int(f[:-len(segment_suffix)]) for f in os.listdir(directory)
+            if f.endswith(segment_suffix)
+        )
+        self.read_offset = self._load_cursor()
+        self.size = sum(
+            os.path.getsize(self._path(s)) for s in self.segments
+        ) - self.read_offset
+
+        # Never append after a record that may be truncated by a crash
+        self._write_file = None
+        self._write_size = 0
+        self._peeked = None
+
+    def _path(self, segment):
+        return os.path.join(
+            self.directory, '%020d%s' % (segment, segment_suffix)
+        )
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, cursor_name)) as f:
+                segment, offset = [int(e) for e in f.read().split()]
+        except (IOError, ValueError):
+            return 0
+        if self.segments and self.segments[0] == segment:
+            return offset
+        return 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, cursor_name)
+        with open(path + '.tmp', 'w') as f:
+            f.write('%d %d' % (self.segments[0], self.read_offset))
+        os.rename(path + '.tmp', path)
+
+    def __len__(self):
+        return self.size
+
+    def _roll(self):
+        if self._write_file is not None:
+            self._write_file.close()
+        segment = self.segments[-1] + 1 if self.segments else 0
+        self._write_file = open(self._path(segment), 'ab')
+        self._write_size = 0
+        self.segments.append(segment)
+
+    def _drop_oldest_segment(self):
+        segment = self.segments.pop(0)
+        path = self._path(segment)
+        dropped = os.path.getsize(path) - self.read_offset
+        os.remove(path)
+        self.size -= dropped
+        self.dropped_bytes += dropped
+        self.read_offset = 0
+        self._peeked = None
+        logger.error(
+            "[influxdb broker] Spool is full, dropped %d bytes" % dropped
+        )
+
+    def append(self, data):
+        with self._lock:
+            if self._write_file is None or \
+                    self._write_size >= self.segment_bytes:
+                self._roll()
+            self._write_file.write(record_header.pack(len(data)))
+            self._write_file.write(data)
+            self._write_file.flush()
+            written = record_header.size + len(data)
+            self._write_size += written
+            self.size += written
+
+            while self.max_bytes and self.size > self.max_bytes:
+                if len(self.segments) == 1:
+                    self._roll()
+                self._drop_oldest_segment()
+
+    def peek(self):
+        """
+        :return: The oldest record or None if the spool is empty
+        """
+        with self._lock:
+            while self.segments:
+                if self._peeked is not None:
+                    return self._peeked
+                with open(self._path(self.segments[0]), 'rb') as f:
+                    f.seek(self.read_offset)
+                    header = f.read(record_header.size)
+                    if len(header) == record_header.size:
+                        length = record_header.unpack(header)[0]
+                        data = f.read(length)
+                        if len(data) == length:
+                            self._peeked = data
+                            continue
+
+                # End of the segment. Keep it if we are still writing in it,
+                # drop it otherwise (the remains of a truncated record are
+                # lost, they were never completely written)
+                if self._write_file is not None and \
+                        self.segments[0] == self.segments[-1]:
+                    return None
+                self._drop_consumed_segment()
+            return None
+
+    def _drop_consumed_segment(self):
+        segment = self.segments.pop(0)
+        path = self._path(segment)
+        self.size -= os.path.getsize(path) - self.read_offset
+        os.remove(path)
+        self.read_offset = 0
+        if self.segments:
+            self._save_cursor()
+        elif os.path.exists(os.path.join(self.directory, cursor_name)):
+            os.remove(os.path.join(self.directory, cursor_name))
+
+    def pop(self):
+        """
+        Forget the record returned by the last peek, it was sent
+        """
+        with self._lock:
+            if self._peeked is None:
+                return
+            read = record_header.size + len(self._peeked)
+            self.read_offset += read
+            self.size -= read
+            self._peeked = None
+            self._save_cursor()
+
+    def close(self):
+        with self._lock:
+            if self._write_file is not None:
+                self._write_file.close()
+                self._write_file = None
+            if self._lock_file is not None:
+                # Closing the file releases the lock
+                self._lock_file.close()
+                self._lock_file = None
@@ -0,0 +1,60 @@
+#!/usr/bin/python
+
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 - Savoir-Faire Linux inc.
+#
+# This file is part of Shinken.
+#
+# Shinken is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Shinken is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Shinken.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+from shinken.log import logger
+
+
+# Thread in charge of draining the broker buffer to influxdb.
+# It calls `flush` every `interval` seconds (or sooner when woken up)
+# so that a slow or hung influxdb never blocks the broker loop.
+class InfluxdbWriter(threading.Thread):
+
+    def __init__(self, flush, interval, name='influxdb-writer'):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.flush = flush
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(
+                    "[influxdb broker] Writer %s error: %s" % (self.name, e)
+                )
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
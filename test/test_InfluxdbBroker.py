@@ -1,5 +1,13 @@
+import gzip
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
 
-from module.module import InfluxdbBroker
+from module.connection import InfluxdbError
+from module.module import InfluxdbBroker, running_instances
+from module.point import Point
 
 from module import get_instance
 
@@ -15,6 +23,46 @@ basic_dict_modconf = dict(
 )
 
 
+def make_point(measurement, value=1.0):
+    return Point(measurement, {'host_name': 'testname'}, 1403618279,
+                 {'value': value})
+
+
+# Records the bodies written, fails after `fail_after` calls or answers
+# with `status_code`. Bodies containing `reject` are refused.
+class FakeClient(object):
+
+    def __init__(self, fail_after=None, status_code=204, reject=None):
+        self.fail_after = fail_after
+        self.status_code = status_code
+        self.reject = reject
+        self.calls = 0
+        self.queries = []
+        self.bodies = []
+        self.headers = []
+
+    def write(self, body, headers=None):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise Exception('influxdb is down')
+        if self.status_code != 204:
+            raise InfluxdbError(self.status_code, 'rejected')
+        if self.reject is not None and self.reject in body:
+            raise InfluxdbError(400, 'field type conflict')
+        self.bodies.append(body)
+        self.headers.append(headers)
+
+    def query(self, query):
+        self.queries.append(query)
+        return {'results': [{'series': [
+            {'name': 'metric_a', 'columns': ['fieldKey', 'fieldType'],
+             'values': [['value', 'integer']]},
+        ]}]}
+
+    def close(self):
+        pass
+
+
 class TestInfluxdbBroker(unittest.TestCase):
 
     def setUp(self):
@@ -68,7 +116,7 @@ class TestInfluxdbBroker(unittest.TestCase):
             tags
         )
         print result
-        self.assertEqual(expected, result)
+        self.assertEqual(expected, [p.to_dict() for p in result])
 
     def test_get_check_result_perfdata_points(self):
         tags = {"host_name": "testname"}
@@ -115,7 +163,106 @@ class TestInfluxdbBroker(unittest.TestCase):
 
         # print result
 
-        self.assertEqual(expected, result)
+        self.assertEqual(expected, [p.to_dict() for p in result])
+
+    def test_perfdata_series_cache(self):
+        broker = get_instance(self.basic_modconf)
+        tags = {'host_name': 'testname', 'service_description': 'disk'}
+
+        broker.get_check_result_perfdata_points('/var=1MB', 1, tags)
+        result = broker.get_check_result_perfdata_points('/var=2MB', 2, tags)
+
+        self.assertEqual(broker.series_cache.misses, 1)
+        self.assertEqual(broker.series_cache.hits, 1)
+        self.assertEqual(result[0].measurement, 'metric__var')
+        self.assertEqual(
+            result[0].prefix,
+            'metric__var,host_name=testname,service_description=disk'
+        )
+
+    def test_perfdata_cache(self):
+        setattr(self.basic_modconf, 'perfdata_cache_size', '10')
+        broker = get_instance(self.basic_modconf)
+        tags = {'host_name': 'testname', 'service_description': 'disk'}
+
+        first = broker.get_check_result_perfdata_points('/var=1MB', 1, tags)
+        same = broker.get_check_result_perfdata_points('/var=1MB', 2, tags)
+        changed = broker.get_check_result_perfdata_points('/var=2MB', 3, tags)
+
+        self.assertEqual(broker.perfdata_cache.hits, 2)
+        self.assertEqual(broker.series_cache.misses, 1)
+        self.assertEqual(broker.series_cache.hits, 1)
+        self.assertEqual(first[0].time, 1)
+        self.assertEqual(
+            [p.to_dict() for p in same],
+            [{'measurement': 'metric__var', 'tags': tags, 'time': 2,
+              'fields': {'value': 1.0, 'unit': 'MB'}}]
+        )
+        self.assertEqual(changed[0].fields, {'value': 2.0, 'unit': 'MB'})
+
+    def test_perfdata_schema_tag(self):
+        setattr(self.basic_modconf, 'perfdata_schema', 'tag')
+        broker = get_instance(self.basic_modconf)
+        tags = {'host_name': 'testname', 'service_description': 'disk'}
+
+        result = broker.get_check_result_perfdata_points(
+            '/var=1MB;2;3 /home=4MB', 1, tags
+        )
+        self.assertEqual(
+            sorted([p.to_dict() for p in result]),
+            sorted([
+                {'measurement': 'perfdata', 'time': 1,
+                 'tags': dict(tags, metric='_var'),
+                 'fields': {'value': 1.0, 'unit': 'MB', 'warning': 2.0,
+                            'critical': 3.0}},
+                {'measurement': 'perfdata', 'time': 1,
+                 'tags': dict(tags, metric='_home'),
+                 'fields': {'value': 4.0, 'unit': 'MB'}},
+            ])
+        )
+        self.assertEqual(
+            sorted([p.prefix for p in result]),
+            ['perfdata,host_name=testname,metric=_home,'
+             'service_description=disk',
+             'perfdata,host_name=testname,metric=_var,'
+             'service_description=disk']
+        )
+        self.assertEqual(broker.endpoints[0].buffer.low_priority_prefix,
+                         'perfdata')
+
+    def test_perfdata_schema_point(self):
+        setattr(self.basic_modconf, 'perfdata_schema', 'point')
+        setattr(self.basic_modconf, 'perfdata_measurement', 'checks')
+        broker = get_instance(self.basic_modconf)
+        tags = {'host_name': 'testname', 'service_description': 'disk'}
+
+        result = broker.get_check_result_perfdata_points(
+            '/var=1MB;2;3 /home=4MB', 1, tags
+        )
+        self.assertEqual([p.to_dict() for p in result], [
+            {'measurement': 'checks', 'time': 1, 'tags': tags,
+             'fields': {'_var': 1.0, '_var.unit': 'MB', '_var.warning': 2.0,
+                        '_var.critical': 3.0, '_home': 4.0,
+                        '_home.unit': 'MB'}}
+        ])
+        self.assertEqual(
+            result[0].prefix,
+            'checks,host_name=testname,service_description=disk'
+        )
+        self.assertEqual(
+            broker.get_check_result_perfdata_points('', 2, tags), []
+        )
+        # The fields of a metric do not collide with another metric
+        result = broker.get_check_result_perfdata_points(
+            'a=1MB a_unit=5', 3, tags
+        )
+        self.assertEqual(result[0].fields, {
+            'a': 1.0, 'a.unit': 'MB', 'a_unit': 5.0, 'a_unit.unit': ''
+        })
+
+    def test_perfdata_schema_invalid(self):
+        setattr(self.basic_modconf, 'perfdata_schema', 'fields')
+        self.assertRaises(ValueError, get_instance, self.basic_modconf)
 
     def test_get_state_update_points(self):
         tags = {'host_name': 'testname'}
@@ -139,7 +286,7 @@ class TestInfluxdbBroker(unittest.TestCase):
                 'tags': {'host_name': 'testname'},
                 'time': 1403618279,
                 'measurement': 'EVENT'}]
-        self.assertEqual(expected, result)
+        self.assertEqual(expected, [p.to_dict() for p in result])
 
         #The state changes
         data = {
@@ -160,7 +307,7 @@ class TestInfluxdbBroker(unittest.TestCase):
                  'event_type': 'ALERT'},
                 'tags': {'host_name': 'testname'},
                 'time': 1403618279, 'measurement': 'EVENT'}]
-        self.assertEqual(expected, result)
+        self.assertEqual(expected, [p.to_dict() for p in result])
 
         #Nothing changes
         data = {
@@ -173,7 +320,7 @@ class TestInfluxdbBroker(unittest.TestCase):
         }
         result = InfluxdbBroker.get_state_update_points(data, tags)
         expected = []
-        self.assertEqual(expected, result)
+        self.assertEqual(expected, [p.to_dict() for p in result])
 
     def test_init_defaults(self):
         broker = InfluxdbBroker(self.basic_modconf)
@@ -185,7 +332,11 @@ class TestInfluxdbBroker(unittest.TestCase):
         self.assertEqual(broker.database, 'database')
         self.assertEqual(broker.use_udp, False)
         self.assertEqual(broker.udp_port, 4444)
-        self.assertEqual(broker.tick_limit, 300)
+        self.assertEqual(broker.buffer_size, 100000)
+        self.assertEqual(broker.buffer_max_bytes, 0)
+        self.assertEqual(broker.buffer_overflow, 'drop_oldest')
+        self.assertEqual(broker.batch_size, 5000)
+        self.assertEqual(broker.flush_interval, 1.0)
 
     def test_init(self):
         modconf = Module(
@@ -199,7 +350,11 @@ class TestInfluxdbBroker(unittest.TestCase):
                 'database': 'testdatabase',
                 'use_udp': '1',
                 'udp_port': '2222',
-                'tick_limit': '3333',
+                'buffer_size': '3333',
+                'buffer_max_bytes': '4444',
+                'buffer_overflow': 'drop_low_priority',
+                'batch_size': '100',
+                'flush_interval': '0.5',
             }
         )
 
@@ -212,47 +367,537 @@ class TestInfluxdbBroker(unittest.TestCase):
         self.assertEqual(broker.database, 'testdatabase')
         self.assertEqual(broker.use_udp, True)
         self.assertEqual(broker.udp_port, 2222)
-        self.assertEqual(broker.tick_limit, 3333)
+        self.assertEqual(broker.buffer_size, 3333)
+        self.assertEqual(broker.buffer_max_bytes, 4444)
+        self.assertEqual(broker.buffer_overflow, 'drop_low_priority')
+        self.assertEqual(broker.batch_size, 100)
+        self.assertEqual(broker.flush_interval, 0.5)
 
     def test_hook_tick(self):
         setattr(self.basic_modconf, 'use_udp', '1')
 
-        data = [
-            {
-                "points": [["1", 1, 1.0], ["2", 2, 2.0]],
-                "name": "foo",
-                "columns": ["column_one", "column_two", "column_three"]
-            }
-        ]
+        data = Point(
+            "foo",
+            {"host_name": "testname"},
+            1403618279,
+            {"column_one": "1", "column_two": 1, "column_three": 1.0}
+        )
 
         broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
         broker.init()
-        broker.buffer.append(data)
-        broker.ticks = 300
-        broker.hook_tick(None)
+        endpoint.stop_writers()
+        endpoint.buffer.append(data)
+        broker.flush()
 
         # We are not testing python-influxdb.
         # We are only making sure that the format of points we are sending
         # does not raise errors and that the buffer empties.
-        self.assertEqual(broker.buffer, [])
-        self.assertEqual(broker.ticks, 0)
+        self.assertEqual(list(endpoint.buffer), [])
+        self.assertEqual(endpoint.breaker.failures, 0)
+
+    def test_flush_failure_keeps_buffer(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.db = FakeClient(fail_after=0)
+        endpoint.buffer.append(make_point('foo'))
+        broker.flush()
+        self.assertEqual(endpoint.breaker.failures, 1)
+        self.assertEqual(list(endpoint.buffer), [make_point('foo')])
+
+        # The circuit is open, influxdb is not hammered
+        broker.flush()
+        self.assertEqual(endpoint.breaker.state, 'open')
+        self.assertEqual(endpoint.breaker.failures, 1)
+
+        # Once the delay is over a small probe closes the circuit before
+        # the rest of the buffer is sent
+        endpoint.db.fail_after = None
+        endpoint.breaker.retry_at = 0
+        broker.probe_size = 1
+        endpoint.buffer.extend([make_point('a'), make_point('b')])
+        broker.flush()
+        self.assertEqual(endpoint.breaker.state, 'closed')
+        self.assertEqual(endpoint.db.bodies, [
+            'foo,host_name=testname value=1.0 1403618279\n',
+            'a,host_name=testname value=1.0 1403618279\n'
+            'b,host_name=testname value=1.0 1403618279\n',
+        ])
+
+    def test_flush_rejected(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.db = FakeClient(status_code=400)
+        endpoint.buffer.append(make_point('foo'))
+        broker.flush()
+
+        # The points are dropped, the server is not considered down
+        self.assertEqual(list(endpoint.buffer), [])
+        self.assertEqual(endpoint.breaker.state, 'closed')
+
+    def test_buffer_overflow(self):
+        setattr(self.basic_modconf, 'buffer_size', '2')
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        broker.extend_buffer([
+            make_point('metric_a'), make_point('EVENT'), make_point('metric_b')
+        ])
+        self.assertEqual(
+            list(endpoint.buffer), [make_point('EVENT'), make_point('metric_b')]
+        )
+        self.assertEqual(endpoint.buffer.dropped, {'metric_a': 1})
+
+        endpoint.report_dropped()
+        self.assertEqual(endpoint.reported_dropped, 1)
+
+    def test_report_invalid(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.db = FakeClient()
+        endpoint.buffer.extend([
+            Point('a', {'host_name': 'caf\xe9'}, 1, {'value': 1.0}),
+            make_point('b'),
+        ])
+        broker.flush()
+        self.assertEqual(broker.serializer.invalid, 1)
+
+        # The next flush reports it
+        broker.flush()
+        self.assertEqual(broker.serializer.reported_invalid, 1)
+
+    def test_flush_bisect(self):
+        directory = tempfile.mkdtemp()
+        try:
+            setattr(self.basic_modconf, 'dead_letter_file',
+                    os.path.join(directory, 'rejected.txt'))
+            broker = InfluxdbBroker(self.basic_modconf)
+            broker.init()
+            endpoint = broker.endpoints[0]
+            endpoint.stop_writers()
+            endpoint.db = FakeClient(reject='value=2.0')
+            endpoint.buffer.extend([
+                make_point(m, 2.0 if m in 'bf' else 1.0) for m in 'abcdefg'
+            ])
+            broker.flush()
+
+            # Only the bad points are left out
+            self.assertEqual(
+                sorted(''.join(endpoint.db.bodies).splitlines()),
+                ['%s,host_name=testname value=1.0 1403618279' % m
+                 for m in 'acdeg']
+            )
+            self.assertEqual(list(endpoint.buffer), [])
+            self.assertEqual(endpoint.breaker.state, 'closed')
+            self.assertEqual(broker.dead_letter.count, 2)
+            with open(broker.dead_letter_file) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), 4)
+            self.assertTrue(lines[0].startswith('# '))
+            self.assertIn('localhost:8086: influxdb returned 400', lines[0])
+            self.assertEqual(
+                lines[1], 'b,host_name=testname value=2.0 1403618279'
+            )
+            self.assertEqual(
+                lines[3], 'f,host_name=testname value=2.0 1403618279'
+            )
+            broker.quit()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_flush_bisect_carriage_return(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.db = FakeClient(reject='value=2.0')
+        endpoint.buffer.extend([
+            Point('EVENT', {'host_name': 'testname'}, 1,
+                  {'output': 'line1\r\nline2'}),
+            make_point('b', 2.0),
+        ])
+        broker.flush()
+
+        # The point with a \r is not cut in two
+        self.assertEqual(
+            endpoint.db.bodies,
+            ['EVENT,host_name=testname output="line1\r\\nline2" 1\n']
+        )
+
+    def test_flush_bisect_limit(self):
+        directory = tempfile.mkdtemp()
+        try:
+            setattr(self.basic_modconf, 'dead_letter_file',
+                    os.path.join(directory, 'rejected.txt'))
+            setattr(self.basic_modconf, 'bisect_max_requests', '4')
+            broker = InfluxdbBroker(self.basic_modconf)
+            broker.init()
+            endpoint = broker.endpoints[0]
+            endpoint.stop_writers()
+            endpoint.db = FakeClient(reject='value=2.0')
+            endpoint.buffer.extend([make_point(str(i), 2.0) for i in range(64)])
+            broker.flush()
+
+            # The batch, then 4 halves, the 3 parts left are dead letters
+            self.assertEqual(endpoint.db.calls, 5)
+            self.assertEqual(endpoint.db.bodies, [])
+            self.assertEqual(list(endpoint.buffer), [])
+            self.assertEqual(broker.dead_letter.count, 64)
+            broker.quit()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_flush_bisect_failure(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.buffer.extend([make_point('a'), make_point('b', 2.0)])
+
+        # The server goes down while bisecting, the batch is kept
+        endpoint.db = FakeClient(fail_after=1, reject='value=2.0')
+        broker.flush()
+        self.assertEqual(
+            list(endpoint.buffer), [make_point('a'), make_point('b', 2.0)]
+        )
+        self.assertEqual(endpoint.breaker.failures, 1)
+
+    def test_flush_batches(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.db = FakeClient(fail_after=2)
+        broker.batch_size = 2
+        endpoint.buffer.extend([make_point(m) for m in 'abcde'])
+        broker.flush()
+
+        # The first two batches were sent, the rest is kept for later
+        self.assertEqual(endpoint.db.bodies, [
+            'a,host_name=testname value=1.0 1403618279\n'
+            'b,host_name=testname value=1.0 1403618279\n',
+            'c,host_name=testname value=1.0 1403618279\n'
+            'd,host_name=testname value=1.0 1403618279\n',
+        ])
+        self.assertEqual(list(endpoint.buffer), [make_point('e')])
+        self.assertEqual(endpoint.breaker.failures, 1)
+
+    def test_flush_bodies(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.db = FakeClient(fail_after=0)
+        endpoint.extend_body('x value=1.0 1\n')
+        endpoint.buffer.append(make_point('a'))
+        broker.flush()
+        self.assertEqual(list(endpoint.bodies), ['x value=1.0 1\n'])
+
+        endpoint.db.fail_after = None
+        endpoint.breaker.retry_at = 0
+        broker.flush()
+        self.assertEqual(endpoint.db.bodies, [
+            'x value=1.0 1\n', 'a,host_name=testname value=1.0 1403618279\n'
+        ])
+        self.assertEqual(endpoint.bodies_points, 0)
 
-    def test_hook_tick_limit(self):
+    def test_flush_gzip(self):
+        setattr(self.basic_modconf, 'compression', 'gzip')
         broker = InfluxdbBroker(self.basic_modconf)
-        broker.tick_limit = 300
-        broker.ticks = 299
-        broker.buffer.append('this_wont_work_lol')
+        endpoint = broker.endpoints[0]
+        endpoint.db = FakeClient()
+        broker.extend_buffer([make_point('a')])
+        broker.flush()
+
+        self.assertEqual(endpoint.db.headers[0]['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.GzipFile(fileobj=StringIO(endpoint.db.bodies[0])).read(),
+            'a,host_name=testname value=1.0 1403618279\n'
+        )
+
+    def test_flush_spool(self):
+        directory = tempfile.mkdtemp()
+        try:
+            setattr(self.basic_modconf, 'spool_dir', directory)
+            broker = InfluxdbBroker(self.basic_modconf)
+            endpoint = broker.endpoints[0]
+            broker.init()
+            endpoint.stop_writers()
+            endpoint.db = FakeClient(fail_after=0)
+            broker.batch_size = 2
+
+            # Unsent points go to the spool, in order
+            broker.extend_buffer([make_point(m) for m in 'abc'])
+            broker.flush()
+            broker.extend_buffer([make_point('d')])
+            broker.flush()
+            self.assertEqual(len(endpoint.buffer), 0)
+            self.assertTrue(len(endpoint.spool) > 0)
+
+            endpoint.db.fail_after = None
+            endpoint.breaker.retry_at = 0
+            broker.extend_buffer([make_point('e')])
+            broker.flush()
+            self.assertEqual(
+                [body[0] for body in endpoint.db.bodies],
+                ['a', 'c', 'd', 'e']
+            )
+            self.assertEqual(len(endpoint.spool), 0)
+            broker.quit()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_spool_locked(self):
+        directory = tempfile.mkdtemp()
+        try:
+            setattr(self.basic_modconf, 'spool_dir', directory)
+            first = InfluxdbBroker(self.basic_modconf).endpoints[0]
+            second = InfluxdbBroker(self.basic_modconf).endpoints[0]
+            first.init()
+            # The directory is used by the first endpoint until it quits
+            second.init()
+            self.assertIsNotNone(first.spool)
+            self.assertIsNone(second.spool)
+            first.quit()
+            second.init()
+            self.assertIsNotNone(second.spool)
+            second.quit()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_init_replaces_previous_instance(self):
+        directory = tempfile.mkdtemp()
+        try:
+            setattr(self.basic_modconf, 'spool_dir', directory)
+            setattr(self.basic_modconf, 'flush_interval', '3600')
+            first = InfluxdbBroker(self.basic_modconf)
+            first.init()
+            self.assertTrue(first.endpoints[0].writers[0].is_alive())
+
+            # Shinken reloaded the configuration without stopping it
+            second = InfluxdbBroker(self.basic_modconf)
+            second.init()
+            self.assertEqual(first.endpoints[0].writers, [])
+            self.assertIsNotNone(second.endpoints[0].spool)
+            self.assertIs(running_instances['influxdbBroker'], second)
+
+            second.quit()
+            self.assertNotIn('influxdbBroker', running_instances)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_hook_tick_does_not_write(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        broker.flush_interval = 3600
+        endpoint.buffer.append('this_wont_work_lol')
         broker.hook_tick(None)
+
+        # The tick only starts the writers, the buffer is left to them
+        self.assertEqual(list(endpoint.buffer), ['this_wont_work_lol'])
+        self.assertEqual(len(endpoint.writers), 1)
+        self.assertTrue(endpoint.writers[0].is_alive())
+
+        endpoint.stop_writers()
+        self.assertEqual(endpoint.writers, [])
+
+    def test_writer_flushes_buffer(self):
+        setattr(self.basic_modconf, 'use_udp', '1')
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        broker.init()
+        endpoint.buffer.append(
+            {'measurement': 'foo', 'time': 1, 'tags': {}, 'fields': {'a': 1}}
+        )
+        endpoint.writers[0].wakeup()
+
+        for _ in range(50):
+            if not endpoint.buffer:
+                break
+            time.sleep(0.1)
+
+        broker.quit()
+        self.assertEqual(list(endpoint.buffer), [])
+        self.assertEqual(endpoint.writers, [])
+
+
+    def test_field_types(self):
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        broker.extend_buffer([make_point('a', 1.0)])
+        broker.extend_buffer([make_point('a', 2)])
+        self.assertEqual(
+            [p.fields for p in endpoint.buffer],
+            [{'value': 1.0}, {'value': 2.0}]
+        )
+        self.assertEqual(
+            type(endpoint.buffer[1].fields['value']), float
+        )
+
+    def test_field_types_warmup(self):
+        setattr(self.basic_modconf, 'field_type_warmup', '1')
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        endpoint.init()
+        endpoint.db = FakeClient()
+        broker.warm_field_types(endpoint)
+        self.assertEqual(endpoint.db.queries, ['SHOW FIELD KEYS'])
+
+        broker.extend_buffer([make_point('metric_a', 2.0)])
+        self.assertEqual(endpoint.buffer[0].fields, {'value': 2})
+        endpoint.quit()
+
+    def test_aggregate(self):
+        setattr(self.basic_modconf, 'aggregate_window', '60')
+        setattr(self.basic_modconf, 'aggregate_functions', 'max,count')
+        broker = InfluxdbBroker(self.basic_modconf)
+        endpoint = broker.endpoints[0]
+        broker.extend_buffer([
+            Point('metric_a', {}, 60, {'value': 1.0}),
+            Point('metric_a', {}, 70, {'value': 2.0}),
+            Point('EVENT', {}, 70, {'state': 'UP'}),
+        ])
+        self.assertEqual([p.measurement for p in endpoint.buffer], ['EVENT'])
+
+        broker.flush_interval = 3600
         broker.hook_tick(None)
-        self.assertEqual(broker.ticks, 0)
-        self.assertEqual(broker.buffer, [])
+        endpoint.stop_writers()
+        self.assertEqual(
+            [p.fields for p in endpoint.buffer][1:],
+            [{'value_max': 2.0, 'value_count': 2}]
+        )
+
+    def test_aggregate_unknown_function(self):
+        setattr(self.basic_modconf, 'aggregate_functions', 'median')
+        with self.assertRaises(ValueError):
+            InfluxdbBroker(self.basic_modconf)
 
+    def test_state_dedup(self):
+        setattr(self.basic_modconf, 'state_dedup', '1')
+        setattr(self.basic_modconf, 'state_heartbeat', '600')
+        broker = InfluxdbBroker(self.basic_modconf)
+        tags = {'host_name': 'testname', 'service_description': 'http'}
+        data = {
+            'state_id': 0, 'state_type': 'HARD', 'output': 'OK',
+            'problem_has_been_acknowledged': False, 'last_chk': 1000,
+            'last_state_change': 900
+        }
+
+        def state_points(**changes):
+            checked = dict(data, **changes)
+            return broker.get_changed_state_points(
+                checked, 'SERVICE_STATE', tags
+            )
+
+        self.assertEqual(len(state_points()), 1)
+        self.assertEqual(state_points(last_chk=1060), [])
+        self.assertEqual(len(state_points(last_chk=1120, output='OK 2')), 1)
+        self.assertEqual(len(state_points(last_chk=1180, output='OK 2',
+                                          state_id=2)), 1)
+        self.assertEqual(len(state_points(
+            last_chk=1240, output='OK 2', state_id=2,
+            problem_has_been_acknowledged=True
+        )), 1)
+
+        # Other services and hosts are independent
+        self.assertEqual(len(broker.get_changed_state_points(
+            data, 'HOST_STATE', tags
+        )), 1)
+
+        # Heartbeat
+        self.assertEqual(state_points(
+            last_chk=1800, output='OK 2', state_id=2,
+            problem_has_been_acknowledged=True
+        ), [])
+        self.assertEqual(len(state_points(
+            last_chk=1840, output='OK 2', state_id=2,
+            problem_has_been_acknowledged=True
+        )), 1)
+
+    def test_endpoints(self):
+        setattr(self.basic_modconf, 'endpoints', 'influx1, influx2:8087')
+        broker = InfluxdbBroker(self.basic_modconf)
+        self.assertEqual(
+            [e.name for e in broker.endpoints],
+            ['influx1:8086', 'influx2:8087']
+        )
+        self.assertEqual(broker.endpoint_mode, 'replicate')
+
+    def test_endpoints_replicate(self):
+        setattr(self.basic_modconf, 'endpoints', 'influx1,influx2')
+        broker = InfluxdbBroker(self.basic_modconf)
+        for endpoint in broker.endpoints:
+            endpoint.db = FakeClient()
+        broker.extend_buffer([make_point('a'), make_point('b')])
+        broker.flush()
+
+        # Every endpoint gets all the points
+        for endpoint in broker.endpoints:
+            self.assertEqual(endpoint.db.bodies, [
+                'a,host_name=testname value=1.0 1403618279\n'
+                'b,host_name=testname value=1.0 1403618279\n'
+            ])
+
+    def test_endpoints_shard(self):
+        setattr(self.basic_modconf, 'endpoints', 'influx1,influx2,influx3')
+        setattr(self.basic_modconf, 'endpoint_mode', 'shard')
+        broker = InfluxdbBroker(self.basic_modconf)
+        points = [
+            Point('metric_%d' % (i % 10), {'host_name': 'host%d' % i}, 1,
+                  {'value': 1.0})
+            for i in range(300)
+        ]
+        broker.extend_buffer(points)
+
+        # Every point is in exactly one buffer, all the points of a series
+        # are on the same endpoint
+        buffered = []
+        for endpoint in broker.endpoints:
+            self.assertTrue(len(endpoint.buffer) > 0)
+            buffered.extend(endpoint.buffer)
+        self.assertEqual(len(buffered), len(points))
+        for point in points:
+            owner = broker.ring.get_node(
+                point.tags['host_name'] + point.measurement
+            )
+            self.assertIn(point, list(owner.buffer))
+
+    def test_endpoints_shard_without_host(self):
+        setattr(self.basic_modconf, 'endpoints', 'a:1,b:2')
+        setattr(self.basic_modconf, 'endpoint_mode', 'shard')
+        setattr(self.basic_modconf, 'event_types',
+                'TIMEPERIOD_TRANSITION,EXTERNAL_COMMAND')
+        broker = InfluxdbBroker(self.basic_modconf)
+        broker.manage_broks([Brok('log', {'log': log}) for log in [
+            '[1327392000] TIMEPERIOD TRANSITION: workhours;-1;1',
+            '[1327392000] EXTERNAL COMMAND: RESTART_PROGRAM',
+        ]])
+
+        buffered = []
+        for endpoint in broker.endpoints:
+            buffered.extend(endpoint.buffer)
+        self.assertEqual(
+            sorted([p.tags for p in buffered]),
+            [{'service_description': '_self_',
+              'event_type': 'EXTERNAL_COMMAND',
+              'command': 'RESTART_PROGRAM'},
+             {'service_description': '_self_',
+              'event_type': 'TIMEPERIOD_TRANSITION',
+              'timeperiod': 'workhours'}]
+        )
+
+    def test_compression_invalid(self):
+        setattr(self.basic_modconf, 'compression', 'lz4')
+        with self.assertRaises(ValueError):
+            InfluxdbBroker(self.basic_modconf)
+        setattr(self.basic_modconf, 'compression', 'gzip')
+        for level in ('10', '-2'):
+            setattr(self.basic_modconf, 'compression_level', level)
+            with self.assertRaises(ValueError):
+                InfluxdbBroker(self.basic_modconf)
+
+    def test_endpoint_mode_unknown(self):
+        setattr(self.basic_modconf, 'endpoint_mode', 'broadcast')
+        with self.assertRaises(ValueError):
+            InfluxdbBroker(self.basic_modconf)
 
 class TestInfluxdbBrokerInstance(unittest.TestCase):
 
     def setUp(self):
         self.basic_modconf = Module(basic_dict_modconf)
         self.influx_broker = InfluxdbBroker(self.basic_modconf)
+        self.buffer = self.influx_broker.endpoints[0].buffer
 
     def test_manage_log_brok(self):
         data = {
@@ -265,8 +910,8 @@ class TestInfluxdbBrokerInstance(unittest.TestCase):
         broker.manage_log_brok(brok)
 
         # make sure that this has generated only 1 point
-        self.assertEqual(len(broker.buffer), 1)
-        point = broker.buffer[0]
+        self.assertEqual(len(self.buffer), 1)
+        point = self.buffer[0].to_dict()
 
         # validate the point
         expected = {'fields':
@@ -287,11 +932,11 @@ class TestInfluxdbBrokerInstance(unittest.TestCase):
         data['log'] = '[1402515279] SERVICE NOTIFICATION: admin;localhost;check-ssh;CRITICAL;notify-service-by-email;Connection refused'  # nopep8
         brok = Brok('log', data)
         brok.prepare()
-        broker.buffer = []
+        self.buffer.clear()
         broker.manage_log_brok(brok)
-        point = broker.buffer[0]
-        self.assertEqual(point['measurement'], 'EVENT')
-        self.assertEqual(point['tags']['service_description'], 'check-ssh')
+        point = self.buffer[0]
+        self.assertEqual(point.measurement, 'EVENT')
+        self.assertEqual(point.tags['service_description'], 'check-ssh')
 
     def test_log_brok_illegal_char(self):
         data = {
@@ -301,10 +946,10 @@ class TestInfluxdbBrokerInstance(unittest.TestCase):
         brok.prepare()
         broker = self.influx_broker
         broker.manage_log_brok(brok)
-        point = broker.buffer[0]
-        self.assertEqual(point['measurement'], 'EVENT')
-        self.assertEqual(point['tags']['host_name'], 'www.cibc.com')
-        self.assertEqual(point['tags']['service_description'], 'www.cibc.com')
+        point = self.buffer[0]
+        self.assertEqual(point.measurement, 'EVENT')
+        self.assertEqual(point.tags['host_name'], 'www.cibc.com')
+        self.assertEqual(point.tags['service_description'], 'www.cibc.com')
 
     def test_manage_unknown_host_check_result_brok(self):
         # Prepare the Brok
@@ -321,7 +966,7 @@ class TestInfluxdbBrokerInstance(unittest.TestCase):
         broker.manage_unknown_host_check_result_brok(brok)
 
         self.assertEqual(
-            broker.buffer[0],
+            self.buffer[0].to_dict(),
             {'fields':
                 {'unit': '', 'value': 9999.0},
                 'time': 1234567890,
@@ -344,7 +989,7 @@ class TestInfluxdbBrokerInstance(unittest.TestCase):
         broker = self.influx_broker
         broker.manage_unknown_service_check_result_brok(brok)
         self.assertEqual(
-            broker.buffer[0],
+            self.buffer[0].to_dict(),
             {'fields':
                 {'min': 0.0,
                  'max': 10000.0,
@@ -357,3 +1002,80 @@ class TestInfluxdbBrokerInstance(unittest.TestCase):
                          'host_name': 'test_host_0'},
                 'measurement': 'metric_rtt'}
         )
+
+    def test_manage_broks(self):
+        broks = [
+            Brok('unknown_host_check_result', {
+                'time_stamp': 1234567890, 'host_name': 'test_host_%d' % i,
+                'perf_data': 'rtt=%d' % i
+            })
+            for i in range(3)
+        ]
+        broks.append(Brok('program_status', {}))
+        broks.append(Brok('log', {
+            'log': '[1402515279] HOST NOTIFICATION: admin;localhost;CRITICAL;notify-service-by-email;Connection refused'  # nopep8
+        }))
+
+        endpoint = self.influx_broker.endpoints[0]
+        extends = []
+        extend = endpoint.extend
+        endpoint.extend = lambda points: extends.append(points) or \
+            extend(points)
+        self.influx_broker.manage_broks(broks)
+
+        # All the points are buffered at once
+        self.assertEqual(len(extends), 1)
+        self.assertEqual(
+            [(p.measurement, p.tags['host_name']) for p in self.buffer],
+            [('metric_rtt', 'test_host_0'), ('metric_rtt', 'test_host_1'),
+             ('metric_rtt', 'test_host_2'), ('EVENT', 'localhost')]
+        )
+
+    def test_event_types(self):
+        setattr(self.basic_modconf, 'event_types', 'ALERT,EXTERNAL_COMMAND')
+        broker = InfluxdbBroker(self.basic_modconf)
+        buffer = broker.endpoints[0].buffer
+        broker.manage_broks([Brok('log', {'log': log}) for log in [
+            '[1402515279] HOST NOTIFICATION: admin;localhost;CRITICAL;notify-service-by-email;Connection refused',  # nopep8
+            '[1402515279] EXTERNAL COMMAND: ACKNOWLEDGE_HOST_PROBLEM;localhost;1;1;0;admin;On it',  # nopep8
+        ]])
+        self.assertEqual([p.to_dict() for p in buffer], [{
+            'measurement': 'EVENT', 'time': 1402515279,
+            'tags': {'host_name': 'localhost', 'service_description': '_self_',
+                     'event_type': 'EXTERNAL_COMMAND',
+                     'command': 'ACKNOWLEDGE_HOST_PROBLEM'},
+            'fields': {'time': 1402515279, 'arguments': '1;1;0;admin;On it'}
+        }])
+
+    def test_event_types_unknown(self):
+        setattr(self.basic_modconf, 'event_types', 'ALERT,RETENTION')
+        with self.assertRaises(ValueError):
+            InfluxdbBroker(self.basic_modconf)
+
+    def test_schema_file(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('{"EVENT": {"tags": ["state"], "drop": ["output"]}}')
+            setattr(self.basic_modconf, 'schema_file', path)
+            setattr(self.basic_modconf, 'flush_interval', '3600')
+            broker = InfluxdbBroker(self.basic_modconf)
+            broker.init()
+            brok = Brok('log', {
+                'log': '[1329144231] HOST ALERT: localhost;DOWN;SOFT;1;PING CRITICAL'  # nopep8
+            })
+            brok.prepare()
+            broker.manage_log_brok(brok)
+            point = broker.endpoints[0].buffer[0]
+            self.assertEqual(point.tags['state'], 'DOWN')
+            self.assertNotIn('output', point.fields)
+            broker.endpoints[0].buffer.clear()
+            broker.quit()
+
+            # The schema is validated when the module starts
+            with open(path, 'w') as f:
+                f.write('{"EVENT": {"tags": "state"}}')
+            broker = InfluxdbBroker(self.basic_modconf)
+            self.assertRaises(ValueError, broker.init)
+        finally:
+            os.remove(path)
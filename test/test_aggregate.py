@@ -0,0 +1,106 @@
+from module.aggregate import Aggregator
+from module.point import Point
+
+import unittest2 as unittest
+
+tags = {'host_name': 'testname'}
+
+
+def make_point(time, value, measurement='metric_rtt'):
+    return Point(measurement, tags, time, {'value': value, 'unit': 'ms'})
+
+
+class TestAggregator(unittest.TestCase):
+
+    def test_window(self):
+        aggregator = Aggregator(60)
+        self.assertEqual(aggregator.add([
+            make_point(120, 3.0), make_point(130, 1.0), make_point(179, 2.0)
+        ]), [])
+        self.assertEqual(len(aggregator), 1)
+
+        # A sample of the next window closes the previous one
+        result = aggregator.add([make_point(180, 5.0)])
+        self.assertEqual([p.to_dict() for p in result], [{
+            'measurement': 'metric_rtt', 'tags': tags, 'time': 120,
+            'fields': {'unit': 'ms', 'value_min': 1.0, 'value_max': 3.0,
+                       'value_mean': 2.0, 'value_last': 2.0}
+        }])
+
+        result = aggregator.close()
+        self.assertEqual(result[0].time, 180)
+        self.assertEqual(result[0].fields['value_mean'], 5.0)
+        self.assertEqual(len(aggregator), 0)
+
+    def test_functions(self):
+        aggregator = Aggregator(10, ['first', 'sum', 'count'])
+        aggregator.add([make_point(1, 1), make_point(2, 4)])
+        self.assertEqual(aggregator.close()[0].fields, {
+            'unit': 'ms', 'value_first': 1, 'value_sum': 5, 'value_count': 2
+        })
+
+    def test_series(self):
+        aggregator = Aggregator(60)
+        aggregator.add([
+            make_point(1, 1.0), make_point(1, 2.0, 'metric_pl'),
+            Point('metric_rtt', {'host_name': 'other'}, 1, {'value': 3.0}),
+        ])
+        self.assertEqual(len(aggregator), 3)
+
+    def test_passthrough(self):
+        aggregator = Aggregator(60)
+        state = Point('SERVICE_STATE', tags, 1, {'state': 0})
+        no_value = Point('metric_rtt', tags, 1, {'unit': 'ms'})
+        self.assertEqual(aggregator.add([state, no_value]), [state, no_value])
+
+        raw = make_point(1, 1.0)
+        self.assertEqual(Aggregator(60, keep_raw=True).add([raw]), [raw])
+
+    def test_close_before(self):
+        aggregator = Aggregator(60)
+        aggregator.add([
+            make_point(10, 1.0),
+            Point('metric_rtt', {'host_name': 'other'}, 70, {'value': 3.0}),
+        ])
+        self.assertEqual([p.time for p in aggregator.close(100)], [0])
+        self.assertEqual(len(aggregator), 1)
+
+    def test_late_sample(self):
+        aggregator = Aggregator(60)
+        result = aggregator.add([
+            make_point(61, 61.0), make_point(59, 59.0), make_point(62, 62.0),
+            make_point(70, 70.0)
+        ])
+        # The sample of the previous window does not close the current one
+        self.assertEqual(result, [])
+        self.assertEqual(aggregator.late, 1)
+        result = aggregator.close()
+        self.assertEqual([p.time for p in result], [60])
+        self.assertEqual(result[0].fields['value_min'], 61.0)
+        self.assertEqual(result[0].fields['value_max'], 70.0)
+
+    def test_late_after_close(self):
+        aggregator = Aggregator(60)
+        aggregator.add([make_point(10, 1.0)])
+        self.assertEqual(len(aggregator.close(120)), 1)
+
+        # The window at 0 was written
+        self.assertEqual(aggregator.add([make_point(20, 2.0)]), [])
+        self.assertEqual(len(aggregator), 0)
+        self.assertEqual(aggregator.late, 1)
+        aggregator.add([make_point(130, 2.0)])
+        self.assertEqual(len(aggregator), 1)
+
+    def test_close_expired_only(self):
+        aggregator = Aggregator(60)
+        aggregator.add([
+            Point('metric_rtt', {'host_name': 'host%d' % i}, i, {'value': 1.0})
+            for i in range(0, 600, 5)
+        ])
+        self.assertEqual(
+            sorted(aggregator.starts), [0, 60, 120, 180, 240, 300, 360, 420,
+                                        480, 540]
+        )
+        self.assertEqual(len(aggregator.close(180)), 36)
+        self.assertEqual(min(aggregator.starts), 180)
+        self.assertEqual(len(aggregator), 84)
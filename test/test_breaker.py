@@ -0,0 +1,57 @@
+from module.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+import unittest2 as unittest
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_closed(self):
+        breaker = CircuitBreaker()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_open_half_open(self):
+        breaker = CircuitBreaker(backoff_min=10)
+        breaker.failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        # Only one probe once the delay is over
+        breaker.retry_at = 0
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.probing)
+        self.assertFalse(breaker.allow())
+
+        breaker.success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.failures, 0)
+        self.assertTrue(breaker.allow())
+
+    def test_cancel_probe(self):
+        breaker = CircuitBreaker()
+        breaker.failure()
+        breaker.retry_at = 0
+        self.assertTrue(breaker.allow())
+        breaker.cancel_probe()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_backoff(self):
+        breaker = CircuitBreaker(backoff_min=1, backoff_max=60, jitter=0)
+        delays = []
+        for _ in range(8):
+            delays.append(breaker.failure())
+        self.assertEqual(delays, [1, 2, 4, 8, 16, 32, 60, 60])
+
+        # Many failures do not overflow
+        breaker.failures = 5000
+        self.assertEqual(breaker.failure(), 60)
+
+    def test_jitter(self):
+        breaker = CircuitBreaker(backoff_min=8, jitter=0.5)
+        for _ in range(100):
+            breaker.failures = 0
+            delay = breaker.failure()
+            self.assertTrue(4 <= delay <= 8)
@@ -0,0 +1,105 @@
+
+from module.buffer import PointBuffer
+from module.point import Point
+
+import unittest2 as unittest
+
+
+def point(measurement, value=1.0):
+    return Point(measurement, {'host_name': 'testname'}, 1403618279,
+                 {'value': value})
+
+
+class TestPointBuffer(unittest.TestCase):
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, PointBuffer, 10, 0, 'drop_everything')
+
+    def test_drop_oldest(self):
+        buffer = PointBuffer(max_points=2)
+        buffer.extend([point('a'), point('b'), point('c')])
+        self.assertEqual(
+            [p.measurement for p in buffer], ['b', 'c']
+        )
+        self.assertEqual(buffer.dropped, {'a': 1})
+        self.assertEqual(buffer.dropped_total, 1)
+
+    def test_drop_newest(self):
+        buffer = PointBuffer(max_points=2, overflow_policy='drop_newest')
+        buffer.extend([point('a'), point('b'), point('c')])
+        self.assertEqual(
+            [p.measurement for p in buffer], ['a', 'b']
+        )
+        self.assertEqual(buffer.dropped, {'c': 1})
+
+    def test_drop_low_priority(self):
+        buffer = PointBuffer(
+            max_points=3, overflow_policy='drop_low_priority'
+        )
+        buffer.extend([
+            point('EVENT'), point('metric_a'), point('metric_b'),
+            point('HOST_STATE'), point('EVENT'),
+        ])
+        # Both metric points are dropped before any event
+        self.assertEqual(
+            [p.measurement for p in buffer],
+            ['EVENT', 'HOST_STATE', 'EVENT']
+        )
+        self.assertEqual(buffer.dropped, {'metric_a': 1, 'metric_b': 1})
+
+        buffer.append(point('SERVICE_STATE'))
+        self.assertEqual(
+            [p.measurement for p in buffer],
+            ['HOST_STATE', 'EVENT', 'SERVICE_STATE']
+        )
+        self.assertEqual(buffer.dropped_total, 3)
+
+    def test_max_bytes(self):
+        buffer = PointBuffer(max_bytes=100)
+        buffer.extend([point('a'), point('b'), point('c')])
+        self.assertTrue(buffer.size <= 100)
+        self.assertEqual(len(buffer), 2)
+
+        buffer.pop_batch(2)
+        self.assertEqual(buffer.size, 0)
+
+    def test_pop_and_requeue(self):
+        buffer = PointBuffer(max_points=10)
+        buffer.extend([point('a'), point('b'), point('c')])
+
+        batch = buffer.pop_batch(2)
+        self.assertEqual([p.measurement for p in batch], ['a', 'b'])
+        self.assertEqual(len(buffer), 1)
+
+        buffer.requeue(batch)
+        self.assertEqual(
+            [p.measurement for p in buffer], ['a', 'b', 'c']
+        )
+        self.assertEqual(buffer[0].measurement, 'a')
+        self.assertEqual(buffer[-1].measurement, 'c')
+
+    def test_requeue_full(self):
+        buffer = PointBuffer(max_points=5)
+        buffer.extend([point(str(i)) for i in range(5)])
+        batch = buffer.pop_batch(3)
+        buffer.extend([point(str(i)) for i in range(5, 7)])
+        buffer.requeue(batch)
+
+        # Only the newest popped point fits, the older ones are dropped
+        self.assertEqual(
+            [p.measurement for p in buffer], ['2', '3', '4', '5', '6']
+        )
+        self.assertEqual(buffer.dropped_total, 2)
+
+    def test_requeue_low_priority(self):
+        buffer = PointBuffer(max_points=3, overflow_policy='drop_low_priority')
+        buffer.extend([point('EVENT'), point('metric_a'), point('metric_b')])
+        batch = buffer.pop_batch(1)
+        buffer.extend([point('metric_c')])
+        buffer.requeue(batch)
+
+        # The high priority point takes the place of the oldest metric
+        self.assertEqual(
+            [p.measurement for p in buffer], ['EVENT', 'metric_b', 'metric_c']
+        )
+        self.assertEqual(buffer.dropped, {'metric_a': 1})
@@ -0,0 +1,139 @@
+from module.cardinality import BloomFilter, CardinalityGuard
+from module.module import InfluxdbBroker
+from module.point import Point
+
+from shinken.objects.module import Module
+
+import unittest2 as unittest
+
+
+def make_points(host, names, time=1):
+    tags = {'host_name': host, 'service_description': 'proc'}
+    return [Point('metric_%s' % name, tags, time, {'value': 1.0})
+            for name in names]
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_contains(self):
+        bloom = BloomFilter(1000)
+        keys = [u'metric_%d,host_name=srv' % i for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        for key in keys:
+            self.assertIn(key, bloom)
+        unknown = sum(1 for i in range(1000, 11000)
+                      if u'metric_%d,host_name=srv' % i in bloom)
+        self.assertLess(unknown, 300)
+
+
+class TestCardinalityGuard(unittest.TestCase):
+
+    def test_host_limit(self):
+        guard = CardinalityGuard(host_limit=3)
+        points = guard.check(make_points('a', range(5)))
+        self.assertEqual(
+            [p.measurement for p in points],
+            ['metric_0', 'metric_1', 'metric_2']
+        )
+        # The known series are still written, the other hosts have their
+        # own limit
+        points = guard.check(
+            make_points('a', [0, 5], 2) + make_points('b', [5], 2)
+        )
+        self.assertEqual(
+            [(p.tags['host_name'], p.measurement) for p in points],
+            [('a', 'metric_0'), ('b', 'metric_5')]
+        )
+        self.assertEqual(guard.series, 4)
+        self.assertEqual(guard.host_series, {'a': 3, 'b': 1})
+        self.assertEqual(guard.excess, {'a': 3})
+
+    def test_limit(self):
+        guard = CardinalityGuard(limit=2)
+        points = guard.check(
+            make_points('a', [0]) + make_points('b', [0, 1])
+        )
+        self.assertEqual(len(points), 2)
+        self.assertEqual(guard.excess, {'b': 1})
+
+    def test_only_perfdata(self):
+        guard = CardinalityGuard(host_limit=1)
+        tags = {'host_name': 'a', 'service_description': 'proc'}
+        points = make_points('a', [0, 'pid_1234']) + [
+            Point('SERVICE_STATE', tags, 1, {'state': 0}),
+            Point('EVENT', tags, 1, {'state': 'OK'}),
+        ]
+        self.assertEqual(
+            [p.measurement for p in guard.check(points)],
+            ['metric_0', 'SERVICE_STATE', 'EVENT']
+        )
+        self.assertEqual(guard.host_series, {'a': 1})
+
+    def test_report(self):
+        guard = CardinalityGuard(host_limit=1)
+        guard.check(make_points('a', range(3)))
+        self.assertEqual(guard.report(10), [])
+        self.assertEqual(guard.reported, {'a': 2})
+
+    def test_report_warning_interval(self):
+        guard = CardinalityGuard(host_limit=1)
+        guard.check(make_points('a', range(3)))
+        guard.report(10)
+        self.assertEqual(guard.last_warning, 10)
+        self.assertEqual(guard.warned, {'a': 2})
+
+        # Not warned again within a minute, the points are still counted
+        guard.check(make_points('a', [3], 2))
+        guard.report(20)
+        self.assertEqual(guard.last_warning, 10)
+        self.assertEqual(guard.warned, {'a': 2})
+        self.assertEqual(guard.reported, {'a': 3})
+        guard.report(70)
+        self.assertEqual(guard.last_warning, 70)
+        self.assertEqual(guard.warned, {'a': 3})
+
+    def test_count(self):
+        guard = CardinalityGuard(host_limit=1, overflow='count')
+        guard.check(make_points('a', range(3)) + make_points('b', range(2)))
+        self.assertEqual([p.to_dict() for p in guard.report(10)], [
+            {'measurement': 'series_overflow', 'tags': {'host_name': 'a'},
+             'time': 10, 'fields': {'points': 2}},
+            {'measurement': 'series_overflow', 'tags': {'host_name': 'b'},
+             'time': 10, 'fields': {'points': 1}},
+        ])
+        # Only the points since the last report are counted
+        guard.check(make_points('a', [3], 2))
+        self.assertEqual([p.to_dict() for p in guard.report(20)], [
+            {'measurement': 'series_overflow', 'tags': {'host_name': 'a'},
+             'time': 20, 'fields': {'points': 1}},
+        ])
+
+    def test_invalid_overflow(self):
+        self.assertRaises(
+            ValueError, CardinalityGuard, 10, 0, 'truncate'
+        )
+
+
+class TestBrokerSeriesLimit(unittest.TestCase):
+
+    def test_dispatch(self):
+        broker = InfluxdbBroker(Module({
+            'module_name': 'influxdbBroker', 'module_type': 'influxdbBroker',
+            'series_host_limit': '2', 'series_overflow': 'count',
+            'serializer_processes': '2', 'flush_interval': '3600'
+        }))
+        broker.init()
+        # The series are counted by the broker
+        self.assertIsNone(broker.pipeline)
+        endpoint = broker.endpoints[0]
+        endpoint.stop_writers()
+        broker.extend_buffer(make_points('a', range(3)))
+        self.assertEqual(len(endpoint.buffer), 2)
+
+        # The dropped points are counted at every tick
+        broker.hook_tick(None)
+        endpoint.stop_writers()
+        self.assertEqual(endpoint.buffer[2].measurement, 'series_overflow')
+        self.assertEqual(endpoint.buffer[2].fields, {'points': 1})
+        endpoint.buffer.clear()
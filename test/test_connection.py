@@ -0,0 +1,82 @@
+
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from module.connection import InfluxdbConnection, InfluxdbError
+
+import requests
+import unittest2 as unittest
+
+
+class FakeInfluxdbHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        server.requests.append((
+            self.client_address, self.path,
+            self.headers.getheader('Authorization'),
+            self.rfile.read(int(self.headers.getheader('Content-Length')))
+        ))
+        time.sleep(server.delay)
+        self.send_response(server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestInfluxdbConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeInfluxdbHandler)
+        self.server.requests = []
+        self.server.status = 204
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.connection = InfluxdbConnection(
+            '127.0.0.1', self.server.server_port, 'root', 'secret', 'shinken',
+            read_timeout=0.5
+        )
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_write_keep_alive(self):
+        self.connection.write('a value=1.0 1\n')
+        self.connection.write('b value=1.0 1\n')
+
+        self.assertEqual(len(self.server.requests), 2)
+        first, second = self.server.requests
+        # Both writes used the same connection
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(first[1], '/write?db=shinken&precision=s')
+        self.assertEqual(first[2], 'Basic cm9vdDpzZWNyZXQ=')
+        self.assertEqual(second[3], 'b value=1.0 1\n')
+
+    def test_write_error(self):
+        self.server.status = 400
+        with self.assertRaises(InfluxdbError) as context:
+            self.connection.write('a value=1.0 1\n')
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertTrue(context.exception.rejected)
+
+    def test_error_rejected(self):
+        self.assertTrue(InfluxdbError(422, '').rejected)
+        self.assertFalse(InfluxdbError(500, '').rejected)
+        self.assertFalse(InfluxdbError(503, '').rejected)
+        self.assertFalse(InfluxdbError(401, '').rejected)
+        self.assertFalse(InfluxdbError(429, '').rejected)
+
+    def test_read_timeout(self):
+        self.server.delay = 1
+        self.assertRaises(
+            requests.exceptions.Timeout,
+            self.connection.write, 'a value=1.0 1\n'
+        )
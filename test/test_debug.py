@@ -0,0 +1,32 @@
+import logging
+
+from module.debug import DebugSampler, debug_enabled
+
+from shinken.log import logger
+
+import unittest2 as unittest
+
+
+class TestDebug(unittest.TestCase):
+
+    def test_debug_enabled(self):
+        level = logger.level
+        try:
+            logger.setLevel(logging.INFO)
+            self.assertFalse(debug_enabled())
+            logger.setLevel(logging.DEBUG)
+            self.assertTrue(debug_enabled())
+        finally:
+            logger.setLevel(level)
+
+    def test_sample_all(self):
+        items = range(5)
+        self.assertIs(DebugSampler().sample(items), items)
+        self.assertIs(DebugSampler(0).sample(items), items)
+
+    def test_sample(self):
+        sampler = DebugSampler(3)
+        self.assertEqual(sampler.sample(range(0, 5)), [0, 3])
+        self.assertEqual(sampler.sample(range(5, 7)), [6])
+        self.assertEqual(sampler.sample(range(7, 8)), [])
+        self.assertEqual(sampler.sample(range(8, 13)), [9, 12])
@@ -0,0 +1,70 @@
+from module.fieldtypes import FieldTypeRegistry, coerce
+from module.point import Point
+
+import unittest2 as unittest
+
+
+def make_point(measurement, **fields):
+    return Point(measurement, {'host_name': 'testname'}, 1, fields)
+
+
+class TestFieldTypeRegistry(unittest.TestCase):
+
+    def test_coerce(self):
+        self.assertEqual(coerce(1, 'float'), 1.0)
+        self.assertEqual(coerce('1.5', 'float'), 1.5)
+        self.assertEqual(coerce('foo', 'float'), None)
+        self.assertEqual(coerce(True, 'float'), None)
+        self.assertEqual(coerce(2.0, 'integer'), 2)
+        self.assertEqual(coerce(2.5, 'integer'), None)
+        self.assertEqual(coerce('3', 'integer'), 3)
+        self.assertEqual(coerce(1, 'boolean'), True)
+        self.assertEqual(coerce('false', 'boolean'), False)
+        self.assertEqual(coerce(2, 'boolean'), None)
+        self.assertEqual(coerce(2, 'string'), '2')
+        self.assertEqual(coerce(u'\xe9', 'string'), u'\xe9')
+
+    def test_first_type_wins(self):
+        registry = FieldTypeRegistry()
+        first = make_point('EVENT', state=2, output='ok')
+        self.assertEqual(registry.check([first]), [first])
+
+        second = make_point('EVENT', state='CRITICAL', output=3)
+        self.assertEqual(registry.check([second]), [second])
+        self.assertEqual(second.fields, {'output': '3'})
+        self.assertEqual(registry.coerced, 1)
+        self.assertEqual(registry.dropped, 1)
+
+        # Other measurements are independent
+        other = make_point('HOST_STATE', state='UP')
+        registry.check([other])
+        self.assertEqual(other.fields, {'state': 'UP'})
+
+    def test_points_without_fields_are_dropped(self):
+        registry = FieldTypeRegistry()
+        registry.check([make_point('metric_a', value=1.0)])
+        self.assertEqual(registry.check([make_point('metric_a', value='x')]),
+                         [])
+
+    def test_new_field_in_conflicting_point(self):
+        registry = FieldTypeRegistry()
+        registry.check([make_point('metric_a', value=1.0)])
+        point = make_point('metric_a', value=2, max=10)
+        registry.check([point])
+        self.assertEqual(point.fields, {'value': 2.0, 'max': 10})
+        self.assertEqual(registry.types[('metric_a', 'max')], 'integer')
+
+    def test_warm(self):
+        registry = FieldTypeRegistry()
+        count = registry.warm({'results': [{'series': [
+            {'name': 'metric_rtt', 'columns': ['fieldKey', 'fieldType'],
+             'values': [['value', 'float'], ['unit', 'string']]},
+            {'name': 'EVENT', 'columns': ['fieldKey', 'fieldType'],
+             'values': [['state', 'string']]},
+        ]}]})
+        self.assertEqual(count, 3)
+        self.assertEqual(len(registry), 3)
+
+        point = make_point('metric_rtt', value=3, unit='ms')
+        registry.check([point])
+        self.assertEqual(point.fields, {'value': 3.0, 'unit': 'ms'})
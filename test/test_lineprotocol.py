@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from module.lineprotocol import LineSerializer
+from module.point import Point
+
+import unittest2 as unittest
+
+try:
+    from influxdb.line_protocol import make_lines
+except ImportError:
+    make_lines = None
+
+
+class TestLineSerializer(unittest.TestCase):
+
+    def setUp(self):
+        self.serializer = LineSerializer()
+
+    def test_serialize(self):
+        points = [
+            Point(
+                'SERVICE_STATE',
+                {'host_name': 'localhost', 'service_description': 'check ssh'},
+                1403618279,
+                {'state': 2, 'output': 'Connection "refused"', 'value': 1.5},
+            ),
+            Point(
+                'metric_rta',
+                {'host_name': 'a,b=c'},
+                1403618279,
+                {'value': 12.0, 'unit': 'ms', 'min': None},
+            ),
+        ]
+        self.assertEqual(
+            self.serializer.serialize(points),
+            'SERVICE_STATE,host_name=localhost,service_description=check\\ ssh'
+            ' output="Connection \\"refused\\"",state=2i,value=1.5'
+            ' 1403618279\n'
+            'metric_rta,host_name=a\\,b\\=c unit="ms",value=12.0'
+            ' 1403618279\n'
+        )
+
+    @unittest.skipIf(make_lines is None, 'influxdb-python is not installed')
+    def test_same_as_influxdb_client(self):
+        points = [
+            Point(
+                u'metric_t\xe9mp, x',
+                {'host_name': u'h\xf4te', 'service_description': ''},
+                1403618279,
+                {'value': 0.1, 'output': 'back\\slash\nnewline',
+                 'attempts': 3},
+            ),
+        ]
+        self.assertEqual(
+            self.serializer.serialize(points).decode('utf-8'),
+            make_lines({'points': [p.to_dict() for p in points]})
+        )
+
+    def test_prefix_cache(self):
+        self.serializer = LineSerializer(cache_size=1)
+        point = Point('a', {'h': 'x'}, 1, {'value': 1.0})
+        self.serializer.serialize([point])
+        self.serializer.serialize([point])
+        self.assertEqual(len(self.serializer.prefixes), 1)
+        self.assertEqual(self.serializer.prefixes.hits, 1)
+        self.assertEqual(self.serializer.prefixes.misses, 1)
+
+        point.tags = {'h': 'y'}
+        self.assertEqual(
+            self.serializer.serialize([point]), 'a,h=y value=1.0 1\n'
+        )
+        self.assertEqual(len(self.serializer.prefixes), 1)
+
+    def test_known_prefix(self):
+        point = Point('a', {'h': 'x'}, 1, {'value': 1.0}, prefix=u'b,h=y')
+        self.assertEqual(
+            self.serializer.serialize([point]), 'b,h=y value=1.0 1\n'
+        )
+        self.assertEqual(len(self.serializer.prefixes), 0)
+
+    def test_invalid_points(self):
+        points = [
+            'this_wont_work_lol',
+            Point('a', {}, 1, {}),
+            Point('b', {}, 1, {'value': 1.0}),
+        ]
+        self.assertEqual(self.serializer.serialize(points), 'b value=1.0 1\n')
+        self.assertEqual(self.serializer.invalid, 1)
+        self.assertEqual(self.serializer.pop_invalid(), 1)
+        self.assertEqual(self.serializer.pop_invalid(), 0)
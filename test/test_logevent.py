@@ -0,0 +1,170 @@
+import json
+import os
+import tempfile
+
+from module.logevent import LogEvent, LogEventParser, event_types, \
+    load_event_types, name_groups
+
+from shinken.misc.logevent import LogEvent as ShinkenLogEvent
+
+import unittest2 as unittest
+
+logs = [
+    '[1402515279] HOST NOTIFICATION: admin;localhost;CRITICAL;notify-service-by-email;Connection refused',  # nopep8
+    '[1402515279] SERVICE NOTIFICATION: admin;localhost;check-ssh;CRITICAL;ACKNOWLEDGEMENT (CRITICAL);notify-service-by-email;Connection refused',  # nopep8
+    '[1329144231] SERVICE ALERT: dfw01-is02-006;cpu load maui;WARNING;HARD;4;WARNING - load average: 5.04, 4.67, 5.04',  # nopep8
+    '[1329144231] HOST ALERT: localhost;DOWN;SOFT;1;PING CRITICAL - Packet loss = 100%',  # nopep8
+    '[1279250211] HOST DOWNTIME ALERT: maast64;STARTED; Host has entered a period of scheduled downtime',  # nopep8
+    '[1279250211] SERVICE DOWNTIME ALERT: maast64;ssh;STOPPED; Service has exited from a period of scheduled downtime',  # nopep8
+    '[1375301662] SERVICE FLAPPING ALERT: testhost;check_ssh;STARTED; Service appears to have started flapping (24.2% change >= 20.0% threshold)',  # nopep8
+    '[1375301662] HOST FLAPPING ALERT: hostbw;STARTED; Host appears to have started flapping (20.1% change > 20.0% threshold)',  # nopep8
+    '[1402515279] CURRENT HOST STATE: localhost;UP;HARD;1;PING OK',
+    '[1402515279] EXTERNAL COMMAND: ACKNOWLEDGE_HOST_PROBLEM;localhost;1;1;0;admin;ok',  # nopep8
+    '[1402515279] HOST ALERT',
+    '[1402515279] HOST ALERT: broken',
+    '[140251527] HOST ALERT: localhost;DOWN;SOFT;1;output',
+    '[14025152x9] HOST ALERT: localhost;DOWN;SOFT;1;output',
+    'Warning: the configuration is old',
+    '',
+]
+
+
+class TestLogEvent(unittest.TestCase):
+
+    def test_same_as_shinken(self):
+        for log in logs:
+            self.assertEqual(
+                LogEvent(log).data, ShinkenLogEvent(log).data, log
+            )
+
+    def test_name_groups(self):
+        self.assertEqual(
+            name_groups(r'\[([0-9]{10})] (?:(\(x\)[(]);)?(a|b)', 'tuv'),
+            r'\[(?P<t>[0-9]{10})] (?:(?P<u>\(x\)[(]);)?(?P<v>a|b)'
+        )
+
+    def test_types(self):
+        event = LogEvent(logs[2])
+        self.assertEqual(event['time'], 1329144231)
+        self.assertEqual(event['attempts'], 4)
+        self.assertEqual(event['service_desc'], 'cpu load maui')
+        self.assertEqual(len(LogEvent(logs[-2])), 0)
+
+    def test_parser(self):
+        parser = LogEventParser({'ALERT': event_types['ALERT']})
+        self.assertEqual(parser.parse(logs[0]), None)
+        self.assertEqual(parser.parse(logs[3]), {
+            'time': 1329144231, 'alert_type': 'HOST', 'event_type': 'ALERT',
+            'hostname': 'localhost', 'service_desc': None, 'state': 'DOWN',
+            'state_type': 'SOFT', 'attempts': 1,
+            'output': 'PING CRITICAL - Packet loss = 100%'
+        })
+
+    def test_more_event_types(self):
+        parser = LogEventParser(event_types)
+        self.assertEqual(parser.parse(
+            '[1402515279] CURRENT SERVICE STATE: localhost;ssh;OK;HARD;1;SSH OK'
+        ), {
+            'time': 1402515279, 'event_type': 'CURRENT_STATE',
+            'alert_type': 'SERVICE', 'hostname': 'localhost',
+            'service_desc': 'ssh', 'state': 'OK', 'state_type': 'HARD',
+            'attempts': 1, 'output': 'SSH OK'
+        })
+        self.assertEqual(parser.parse(
+            '[1402515279] CURRENT HOST STATE: localhost;UP;HARD;1;OK; up'
+        )['output'], 'OK; up')
+        self.assertEqual(parser.parse(
+            '[1402515279] PASSIVE HOST CHECK: localhost;2;Backup failed'
+        )['return_code'], 2)
+        self.assertEqual(parser.parse(
+            '[1402515279] EXTERNAL COMMAND: ACKNOWLEDGE_SVC_PROBLEM;'
+            'localhost;ssh;2;1;0;admin;On it'
+        ), {
+            'time': 1402515279, 'event_type': 'EXTERNAL_COMMAND',
+            'command': 'ACKNOWLEDGE_SVC_PROBLEM', 'hostname': 'localhost',
+            'service_desc': 'ssh', 'arguments': '2;1;0;admin;On it'
+        })
+        self.assertEqual(parser.parse(
+            '[1402515279] EXTERNAL COMMAND: RESTART_PROGRAM'
+        )['hostname'], None)
+        self.assertEqual(parser.parse(
+            '[1327392000] TIMEPERIOD TRANSITION: workhours;-1;1'
+        )['from'], -1)
+        self.assertEqual(parser.tags['TIMEPERIOD_TRANSITION'], ['timeperiod'])
+
+    def test_external_commands(self):
+        parser = LogEventParser(
+            {'EXTERNAL_COMMAND': event_types['EXTERNAL_COMMAND']}
+        )
+        commands = {
+            'ACKNOWLEDGE_HOST_PROBLEM;localhost;1;1;0;admin;ok':
+                ('localhost', None, '1;1;0;admin;ok'),
+            'PROCESS_SERVICE_CHECK_RESULT;localhost;ssh;0;OK':
+                ('localhost', 'ssh', '0;OK'),
+            'ENABLE_HOST_SVC_CHECKS;localhost': ('localhost', None, None),
+            # The first argument is not a host
+            'PROCESS_FILE;/tmp/cmds;0': (None, None, '/tmp/cmds;0'),
+            'ENABLE_HOSTGROUP_SVC_CHECKS;linux-servers':
+                (None, None, 'linux-servers'),
+            'SCHEDULE_HOSTGROUP_SVC_DOWNTIME;linux-servers;1;2;1;0;0;a;c':
+                (None, None, 'linux-servers;1;2;1;0;0;a;c'),
+            'DEL_HOST_COMMENT;12': (None, None, '12'),
+            'DEL_SVC_DOWNTIME;12': (None, None, '12'),
+        }
+        for command, expected in commands.iteritems():
+            event = parser.parse(
+                '[1402515279] EXTERNAL COMMAND: %s' % command
+            )
+            self.assertEqual(
+                (event['hostname'], event['service_desc'],
+                 event['arguments']), expected
+            )
+            self.assertEqual(event['command'], command.split(';')[0])
+
+    def test_alternative_groups(self):
+        parser = LogEventParser({'TEST': {
+            'headers': ['TEST'],
+            'pattern': r'^\[([0-9]{10})\] TEST: (?:a=([0-9]+)|b=([0-9]+))',
+            'properties': ['time', 'value', 'value'],
+            'types': {'value': int},
+        }})
+        self.assertEqual(parser.parse('[1402515279] TEST: b=2'), {
+            'time': 1402515279, 'event_type': 'TEST', 'value': 2
+        })
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(ValueError):
+            LogEventParser({'BAD': {
+                'headers': ['BAD'], 'pattern': '(a)(b)', 'properties': ['a']
+            }})
+        with self.assertRaises(ValueError):
+            LogEventParser({'BAD': {
+                'headers': ['BAD'], 'pattern': '(a', 'properties': ['a']
+            }})
+
+    def test_no_event_types(self):
+        self.assertEqual(LogEventParser({}).parse(logs[0]), None)
+
+    def test_load_event_types(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'RETENTION': {
+                    'headers': ['RETENTION SAVE'],
+                    'pattern': '^\\[([0-9]{10})\\] RETENTION SAVE: (.*);([0-9]+)',
+                    'properties': ['time', 'scheduler', 'objects'],
+                    'types': {'objects': 'int'},
+                    'tags': ['scheduler'],
+                }}, f)
+            parser = LogEventParser(load_event_types(path))
+            self.assertEqual(
+                parser.parse('[1402515279] RETENTION SAVE: scheduler-1;42'),
+                {'time': 1402515279, 'event_type': 'RETENTION',
+                 'scheduler': 'scheduler-1', 'objects': 42}
+            )
+
+            with open(path, 'w') as f:
+                json.dump({'RETENTION': {'types': {'objects': 'long'}}}, f)
+            self.assertRaises(ValueError, load_event_types, path)
+        finally:
+            os.remove(path)
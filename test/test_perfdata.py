@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+from module.perfdata import parse_perfdata
+
+from shinken.misc.perfdata import PerfDatas
+
+import unittest2 as unittest
+
+
+# The fields the module used to build from PerfDatas
+def reference_fields(perf_data):
+    metrics = {}
+    for name, metric in PerfDatas(perf_data).metrics.iteritems():
+        fields = {}
+        for attribute, field in [('value', 'value'), ('uom', 'unit'),
+                                 ('warning', 'warning'),
+                                 ('critical', 'critical'),
+                                 ('min', 'min'), ('max', 'max')]:
+            value = getattr(metric, attribute, None)
+            if value is not None:
+                if isinstance(value, (int, long)):
+                    value = float(value)
+                fields[field] = value
+        metrics[name] = fields
+    return metrics
+
+
+class TestParsePerfdata(unittest.TestCase):
+
+    samples = [
+        None,
+        '',
+        'ramused=1009MB;;;0;1982 swapused=540PT;;;0;3827 \
+            memused=1550GB;2973;3964;0;5810',
+        'rtt=9999',
+        'rtt=9999;5;10;0;10000',
+        "'label with spaces'=5s;1;2;0;10",
+        "'C:\\ Label'=10%;80;90",
+        'load1=0.250;5.000;10.000;0; load5=0.310;4.000;6.000;0;',
+        'time=0.012345s;;;0.000000 size=1234B;;;0',
+        'used=10%;@10:20;~:30;0;100',
+        'temp=-12.5C;-20:;-30:;-50;50',
+        'big=1e999 small=1e-5 exp=3E2',
+        'dup=1 dup=2',
+        'a=1=2 b=3',
+        'bad=abc next=5',
+        'noequals 5',
+        ' =5 x=1',
+        "''=5",
+        'trailing=5; ',
+        'unit=5c/s;;;',
+        'dots=1.2.3 sign=+-1',
+        u'temp\xe9rature=20.5\xb0C',
+        'multi\nline=1 second=2\n',
+    ]
+
+    def test_same_as_perfdatas(self):
+        for sample in self.samples:
+            self.assertEqual(
+                reference_fields(sample), parse_perfdata(sample),
+                'Different result for %r' % sample
+            )
+
+    def test_same_order_as_perfdatas(self):
+        sample = 'ramused=1009MB;;;0;1982 swapused=540PT;;;0;3827 ' \
+                 'memused=1550GB;2973;3964;0;5810'
+        self.assertEqual(
+            reference_fields(sample).keys(), parse_perfdata(sample).keys()
+        )
+
+    def test_random_perfdata(self):
+        alphabet = "ab '=;:~@.-+eE01%/ \t"
+        rand = random.Random(42)
+        for _ in range(5000):
+            sample = ''.join(
+                rand.choice(alphabet) for _ in range(rand.randint(0, 30))
+            )
+            self.assertEqual(
+                reference_fields(sample), parse_perfdata(sample),
+                'Different result for %r' % sample
+            )
+
+    def test_fields(self):
+        self.assertEqual(
+            parse_perfdata("'disk /'=50%;80;90"),
+            {'disk /': {'value': 50.0, 'unit': '%', 'warning': 80.0,
+                        'critical': 90.0, 'min': 0.0, 'max': 100.0}}
+        )
@@ -0,0 +1,125 @@
+import multiprocessing
+
+from module.module import InfluxdbBroker
+from module.pipeline import SerializerPool
+
+from shinken.objects.module import Module
+
+import unittest2 as unittest
+
+
+class TestSerializerPool(unittest.TestCase):
+
+    def make_broker(self, **conf):
+        conf.update(module_name='influxdbBroker', module_type='influxdbBroker',
+                    serializer_processes='2', flush_interval='3600')
+        broker = InfluxdbBroker(Module(conf))
+        broker.init()
+        for endpoint in broker.endpoints:
+            endpoint.stop_writers()
+        return broker
+
+    def test_serialize(self):
+        broker = self.make_broker()
+        endpoint = broker.endpoints[0]
+        for i in range(50):
+            for host in ('a', 'b', 'c'):
+                tags = {'host_name': host, 'service_description': 'http'}
+                self.assertEqual(
+                    broker.get_perfdata_points('rtt=%d' % i, i, tags), []
+                )
+        broker.pipeline.stop()
+
+        lines = ''.join(endpoint.bodies).splitlines()
+        self.assertEqual(len(lines), 150)
+        self.assertEqual(endpoint.bodies_points, 150)
+        # The points of a series are in order
+        for host in ('a', 'b', 'c'):
+            self.assertEqual(
+                [line for line in lines if 'host_name=%s,' % host in line],
+                ['metric_rtt,host_name=%s,service_description=http '
+                 'unit="",value=%d.0 %d' % (host, i, i) for i in range(50)]
+            )
+        broker.pipeline = None
+        broker.quit()
+
+    def test_shard(self):
+        broker = self.make_broker(
+            endpoints='influx1,influx2', endpoint_mode='shard'
+        )
+        for i in range(100):
+            broker.get_perfdata_points(
+                'rtt=1', 1, {'host_name': 'host%d' % i}
+            )
+        broker.pipeline.stop()
+
+        for endpoint in broker.endpoints:
+            for line in ''.join(endpoint.bodies).splitlines():
+                host = line.split(',')[1].split(' ')[0].split('=')[1]
+                self.assertIs(
+                    broker.ring.get_node(host + 'metric_rtt'), endpoint
+                )
+        self.assertEqual(
+            sum([e.bodies_points for e in broker.endpoints]), 100
+        )
+        broker.pipeline = None
+        broker.quit()
+
+    def test_field_types(self):
+        broker = InfluxdbBroker(Module({
+            'module_name': 'influxdbBroker', 'module_type': 'influxdbBroker',
+            'serializer_processes': '1', 'flush_interval': '3600'
+        }))
+        # As learned by the warmup, before the processes start
+        broker.field_types.learn('metric_rtt', 'value', 'integer')
+        broker.init()
+        for endpoint in broker.endpoints:
+            endpoint.stop_writers()
+        broker.get_perfdata_points('rtt=3', 1, {'host_name': 'a'})
+        broker.pipeline.stop()
+
+        self.assertEqual(
+            ''.join(broker.endpoints[0].bodies),
+            'metric_rtt,host_name=a unit="",value=3i 1\n'
+        )
+        broker.pipeline = None
+        broker.quit()
+
+    def test_dead_worker(self):
+        broker = self.make_broker()
+        worker = broker.pipeline.workers[0]
+        worker.terminate()
+        worker.join()
+
+        # The process is replaced at the next tick
+        broker.hook_tick(None)
+        self.assertTrue(broker.pipeline.workers[0].is_alive())
+        for endpoint in broker.endpoints:
+            endpoint.stop_writers()
+        for i in range(20):
+            broker.get_perfdata_points('rtt=1', 1, {'host_name': 'h%d' % i})
+        broker.pipeline.stop()
+        self.assertEqual(broker.endpoints[0].bodies_points, 20)
+        broker.pipeline = None
+        broker.quit()
+
+    def test_queue_size(self):
+        pool = SerializerPool(None, 2, batch_size=2, max_checks=8)
+        self.assertEqual(pool.queue_size, 2)
+        pool.inboxes = [multiprocessing.Queue(pool.queue_size)]
+        pool.processes = 1
+        pool.pending = [[]]
+        for i in range(8):
+            pool.put('rtt=1', i, {'host_name': 'a'})
+        # The process did not read its inbox, the last batches are dropped
+        self.assertEqual(pool.dropped, 4)
+
+    def test_bodies_limit(self):
+        broker = InfluxdbBroker(Module({
+            'module_name': 'influxdbBroker', 'buffer_size': '3'
+        }))
+        endpoint = broker.endpoints[0]
+        endpoint.extend_body('a 1\nb 1\n')
+        endpoint.extend_body('c 1\nd 1\n')
+        self.assertEqual(list(endpoint.bodies), ['c 1\nd 1\n'])
+        self.assertEqual(endpoint.dropped_bodies_points, 2)
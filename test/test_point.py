@@ -0,0 +1,39 @@
+
+from module.point import Point
+
+import unittest2 as unittest
+
+
+class TestPoint(unittest.TestCase):
+
+    def test_fields(self):
+        point = Point('metric_rtt', {'host_name': 'testname'}, 1403618279,
+                      {'value': 1.0, 'unit': 'ms', 'warning': None})
+        self.assertEqual(point.field_keys, ('unit', 'value'))
+        self.assertEqual(point.field_values, ('ms', 1.0))
+        self.assertEqual(point.fields, {'value': 1.0, 'unit': 'ms'})
+        self.assertEqual(point.to_dict(), {
+            'measurement': 'metric_rtt',
+            'tags': {'host_name': 'testname'},
+            'time': 1403618279,
+            'fields': {'value': 1.0, 'unit': 'ms'},
+        })
+
+    def test_shared_field_keys(self):
+        a = Point('a', {}, 1, {'value': 1.0, 'unit': 'ms'})
+        b = Point('b', {}, 2, {'unit': '%', 'value': 2.0})
+        self.assertTrue(a.field_keys is b.field_keys)
+
+    def test_no_dict(self):
+        point = Point('a', {}, 1, {'value': 1.0})
+        self.assertRaises(AttributeError, setattr, point, 'foo', 'bar')
+
+    def test_equality(self):
+        self.assertEqual(
+            Point('a', {'h': 'x'}, 1, {'value': 1.0}),
+            Point('a', {'h': 'x'}, 1, {'value': 1.0})
+        )
+        self.assertNotEqual(
+            Point('a', {'h': 'x'}, 1, {'value': 1.0}),
+            Point('a', {'h': 'x'}, 2, {'value': 1.0})
+        )
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+
+from module.point import Point
+from module.schema import Schema, load_schema
+
+import unittest2 as unittest
+
+
+class TestSchema(unittest.TestCase):
+
+    def test_apply(self):
+        schema = Schema({
+            'EVENT': {'tags': ['state'], 'fields': ['service_description'],
+                      'drop': ['output']},
+        })
+        tags = {'host_name': 'srv', 'service_description': 'http'}
+        event = Point('EVENT', tags, 1, {
+            'state': 2, 'output': 'CRITICAL - down', 'event_type': 'ALERT'
+        })
+        other = Point('HOST_STATE', tags, 1, {'output': 'ok'})
+
+        result = schema.apply([event, other])
+        self.assertEqual(result[0].to_dict(), {
+            'measurement': 'EVENT', 'time': 1,
+            'tags': {'host_name': 'srv', 'state': '2'},
+            'fields': {'event_type': 'ALERT', 'service_description': 'http'}
+        })
+        self.assertIs(result[1], other)
+        # The shared tags are not modified
+        self.assertEqual(
+            tags, {'host_name': 'srv', 'service_description': 'http'}
+        )
+
+    def test_prefix(self):
+        schema = Schema({
+            'metric_*': {'drop': ['warning']},
+            'metric_rtt*': {'drop': ['critical']},
+            'metric_rtt': {'drop': ['unit']},
+        })
+        fields = {'value': 1.0, 'unit': 'ms', 'warning': 1.0, 'critical': 2.0}
+        points = schema.apply([
+            Point(m, {}, 1, fields)
+            for m in ('metric_rtt', 'metric_rtt_max', 'metric_pl', 'EVENT')
+        ])
+        self.assertEqual(
+            [sorted(p.fields) for p in points],
+            [['critical', 'value', 'warning'], ['unit', 'value', 'warning'],
+             ['critical', 'unit', 'value'],
+             ['critical', 'unit', 'value', 'warning']]
+        )
+
+    def test_point_without_fields(self):
+        schema = Schema({'EVENT': {'tags': ['state']}})
+        self.assertEqual(
+            schema.apply([Point('EVENT', {}, 1, {'state': 'UP'})]), []
+        )
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Schema, {'EVENT': ['state']})
+        self.assertRaises(ValueError, Schema, {'EVENT': {'tag': ['state']}})
+        self.assertRaises(ValueError, Schema, {'EVENT': {'tags': 'state'}})
+        self.assertRaises(
+            ValueError, Schema,
+            {'EVENT': {'tags': ['state'], 'drop': ['state']}}
+        )
+
+    def test_load_schema(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'EVENT': {'drop': ['output']}}, f)
+            schema = load_schema(path)
+            self.assertEqual(
+                schema.get_mapping('EVENT'),
+                (frozenset(), frozenset(), frozenset(['output']))
+            )
+        finally:
+            os.remove(path)
@@ -0,0 +1,30 @@
+from module.sharding import HashRing, hash_key
+
+import unittest2 as unittest
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_hash_key_unicode(self):
+        self.assertEqual(hash_key(u'h\xe9'), hash_key(u'h\xe9'.encode('utf-8')))
+
+    def test_get_node(self):
+        ring = HashRing(['a', 'b', 'c'], ['a', 'b', 'c'])
+        keys = ['host%d' % i for i in range(1000)]
+        owners = [ring.get_node(key) for key in keys]
+
+        # Stable and spread over all the nodes
+        self.assertEqual(owners, [ring.get_node(key) for key in keys])
+        for node in 'abc':
+            self.assertTrue(owners.count(node) > 200)
+
+    def test_remove_node(self):
+        ring = HashRing(['a', 'b', 'c'], ['a', 'b', 'c'])
+        smaller = HashRing(['a', 'b'], ['a', 'b'])
+
+        # Only the keys of the removed node move
+        for i in range(1000):
+            key = 'host%d' % i
+            owner = ring.get_node(key)
+            if owner != 'c':
+                self.assertEqual(smaller.get_node(key), owner)
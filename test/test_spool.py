@@ -0,0 +1,81 @@
+
+import os
+import shutil
+import tempfile
+
+from module.spool import Spool, SpoolLocked
+
+import unittest2 as unittest
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_all(self, spool):
+        records = []
+        while True:
+            record = spool.peek()
+            if record is None:
+                return records
+            records.append(record)
+            spool.pop()
+
+    def test_replay_in_order(self):
+        spool = Spool(self.directory, segment_bytes=10)
+        for record in ['one', 'two', 'three']:
+            spool.append(record)
+
+        self.assertEqual(spool.peek(), 'one')
+        # peek does not consume
+        self.assertEqual(spool.peek(), 'one')
+        self.assertEqual(self.read_all(spool), ['one', 'two', 'three'])
+        self.assertEqual(len(spool), 0)
+
+    def test_replay_after_restart(self):
+        spool = Spool(self.directory, segment_bytes=10)
+        for record in ['one', 'two', 'three']:
+            spool.append(record)
+        spool.peek()
+        spool.pop()
+        spool.close()
+
+        spool = Spool(self.directory, segment_bytes=10)
+        spool.append('four')
+        self.assertEqual(self.read_all(spool), ['two', 'three', 'four'])
+
+    def test_truncated_record(self):
+        spool = Spool(self.directory)
+        spool.append('one')
+        spool.close()
+        # Simulate a crash in the middle of a write
+        with open(os.path.join(self.directory, '%020d.seg' % 0), 'ab') as f:
+            f.write('\x00\x00\x00\x10abc')
+
+        spool = Spool(self.directory)
+        spool.append('two')
+        self.assertEqual(self.read_all(spool), ['one', 'two'])
+
+    def test_max_bytes(self):
+        spool = Spool(self.directory, max_bytes=20, segment_bytes=7)
+        for record in ['one', 'two', 'three', 'four']:
+            spool.append(record)
+
+        self.assertTrue(len(spool) <= 20)
+        self.assertTrue(spool.dropped_bytes > 0)
+        self.assertEqual(self.read_all(spool), ['three', 'four'])
+
+    def test_locked(self):
+        spool = Spool(self.directory)
+        spool.append('one')
+        # A second spool would replay the same records
+        self.assertRaises(SpoolLocked, Spool, self.directory)
+        spool.close()
+
+        spool = Spool(self.directory)
+        self.assertEqual(self.read_all(spool), ['one'])
+        spool.close()